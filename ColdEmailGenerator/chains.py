@@ -1,20 +1,86 @@
+import logging
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import repeat
 # from langchain_groq import ChatGroq
 from langchain.chat_models import init_chat_model
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.exceptions import OutputParserException
 from dotenv import load_dotenv
+from google.api_core.exceptions import ResourceExhausted
+
+from utils import split_segments
 
 load_dotenv()
 
-class Chain:
-    def __init__(self):
-        self.llm = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
-        # self.llm = ChatGroq(temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"), model_name="llama-3.1-70b-versatile")
+logger = logging.getLogger(__name__)
+
+# Emails for a multi-job page are written in parallel, at most this many Gemini calls at once
+MAIL_CONCURRENCY = int(os.getenv("MAIL_CONCURRENCY", "4"))
+# Retries of a rate-limited Gemini call, for extraction and emails alike
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", "5"))
+# Large pages are extracted in segments of about this many tokens, several at once
+EXTRACT_SEGMENT_TOKENS = int(os.getenv("EXTRACT_SEGMENT_TOKENS", "3000"))
+EXTRACT_OVERLAP_TOKENS = int(os.getenv("EXTRACT_OVERLAP_TOKENS", "200"))
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "4"))
+
+
+def is_rate_limited(error):
+    """Whether Gemini refused the call for quota (ResourceExhausted, HTTP 429); the wrapper may only keep the message"""
+    return isinstance(error, ResourceExhausted) or "429" in str(error) or "ResourceExhausted" in str(error)
+
+
+def call_with_retry(call, *args, max_retries=MAIL_MAX_RETRIES):
+    """Call Gemini, waiting 1, 2, 4... seconds (up to 30, a little randomized) after each 429"""
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            return call(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limited(e):
+                raise
+            time.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, 30.0)
+
 
-    def extract_jobs(self, cleaned_text):
-        prompt_extract = PromptTemplate.from_template(
+def _normalize(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+def _same_job(job, kept):
+    if _normalize(job.get('role')) != _normalize(kept.get('role')):
+        return False
+    description, kept_description = _normalize(job.get('description')), _normalize(kept.get('description'))
+    if description and kept_description:
+        return description in kept_description or kept_description in description
+    # Without a description to compare, only an identical posting is a duplicate
+    return all(_normalize(job.get(key)) == _normalize(kept.get(key)) for key in job.keys() | kept.keys())
+
+
+def merge_jobs(job_lists):
+    """Concatenate per-segment job lists in page order, without the duplicates overlapping segments produce.
+
+    Two jobs are the same when their roles match and one description contains the other, as happens
+    when a posting cut by a segment boundary is extracted once whole and once in part; the fuller one is kept.
+    A job without a description is only the same as one whose fields are all equal.
+    """
+    merged = []
+    for jobs in job_lists:
+        for job in jobs:
+            for i, kept in enumerate(merged):
+                if _same_job(job, kept):
+                    if len(_normalize(job.get('description'))) > len(_normalize(kept.get('description'))):
+                        merged[i] = job
+                    break
+            else:
+                merged.append(job)
+    return merged
+
+
+PROMPT_EXTRACT = PromptTemplate.from_template(
             """
             ### SCRAPED TEXT FROM WEBSITE:
             {page_data}
@@ -24,18 +90,9 @@ class Chain:
             Only return the valid JSON.
             ### VALID JSON (NO PREAMBLE):
             """
-        )
-        chain_extract = prompt_extract | self.llm
-        res = chain_extract.invoke(input={"page_data": cleaned_text})
-        try:
-            json_parser = JsonOutputParser()
-            res = json_parser.parse(res.content)
-        except OutputParserException:
-            raise OutputParserException("Context too big. Unable to parse jobs.")
-        return res if isinstance(res, list) else [res]
+)
 
-    def write_mail(self, job, links):
-        prompt_email = PromptTemplate.from_template(
+PROMPT_EMAIL = PromptTemplate.from_template(
         """
         ### JOB DESCRIPTION:
         {job_description}
@@ -53,10 +110,76 @@ class Chain:
         ### EMAIL (NO PREAMBLE):
 
         """
-        )
-        chain_email = prompt_email | self.llm
-        res = chain_email.invoke({"job_description": str(job), "link_list": links})
+)
+
+
+class Chain:
+    def __init__(self):
+        self.llm = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
+        # self.llm = ChatGroq(temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"), model_name="llama-3.1-70b-versatile")
+        # Prompts are compiled once; the app keeps one Chain per process
+        self.chain_extract = PROMPT_EXTRACT | self.llm
+        self.chain_email = PROMPT_EMAIL | self.llm
+
+    def _extract_segment(self, page_data, name="the page"):
+        res = self.chain_extract.invoke(input={"page_data": page_data})
+        try:
+            json_parser = JsonOutputParser()
+            res = json_parser.parse(res.content)
+        except OutputParserException:
+            raise OutputParserException(f"Unable to parse jobs from {name}.")
+        res = res if isinstance(res, list) else [res]
+        return [job for job in res if isinstance(job, dict)]
+
+    def _try_extract_segment(self, page_data, name, max_retries):
+        try:
+            return call_with_retry(self._extract_segment, page_data, name, max_retries=max_retries)
+        except OutputParserException as e:
+            logger.warning("Skipping %s: %s", name, e)
+            return None
+
+    def extract_jobs(self, cleaned_text, segment_tokens=EXTRACT_SEGMENT_TOKENS, overlap_tokens=EXTRACT_OVERLAP_TOKENS,
+                     concurrency=EXTRACT_CONCURRENCY, max_retries=MAIL_MAX_RETRIES):
+        """Extract the job postings of a page.
+
+        A page longer than segment_tokens is split into segments that are extracted up to `concurrency`
+        at a time and merged, so the wait grows with the number of rounds rather than the page length.
+        A segment whose output cannot be parsed is logged and skipped, as long as another one succeeds.
+        """
+        segments = split_segments(cleaned_text, segment_tokens, overlap_tokens)
+        if len(segments) == 1:
+            return call_with_retry(self._extract_segment, cleaned_text, max_retries=max_retries)
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(segments)))) as pool:
+            names = [f"segment {i} of {len(segments)}" for i in range(1, len(segments) + 1)]
+            results = list(pool.map(self._try_extract_segment, segments, names, repeat(max_retries)))
+        parsed = [jobs for jobs in results if jobs is not None]
+        if not parsed:
+            raise OutputParserException("Unable to parse jobs from any part of the page.")
+        return merge_jobs(parsed)
+
+    def write_mail(self, job, links):
+        res = self.chain_email.invoke({"job_description": str(job), "link_list": links})
         return res.content
 
+    def write_mails(self, jobs_with_links, concurrency=MAIL_CONCURRENCY, max_retries=MAIL_MAX_RETRIES):
+        """Write one email per (job, links) pair, up to `concurrency` at a time.
+
+        Yields (position, email, error) in completion order; exactly one of email and error is None.
+        """
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        try:
+            futures = {
+                pool.submit(call_with_retry, self.write_mail, job, links, max_retries=max_retries): position
+                for position, (job, links) in enumerate(jobs_with_links)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # A consumer that stops early (e.g. a Streamlit rerun) does not wait for queued calls
+            pool.shutdown(wait=False, cancel_futures=True)
+
 # if __name__ == "__main__":
 #     print(os.getenv("GROQ_API_KEY"))
\ No newline at end of file
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fetched pages are cached on disk. Within the TTL a page is served without any request;
+# after it, the page is revalidated with If-None-Match / If-Modified-Since, and a
+# 304 Not Modified reuses the cached body.
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", "ColdEmailGenerator/cache/pages")
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "3600"))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "50"))
+REQUEST_TIMEOUT = 10
+POOL_SIZE = 16
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class Page:
+    """A fetched page. `source` is "network", "cache" (no request made) or "revalidated" (304)"""
+
+    def __init__(self, url, status_code, content, encoding, source):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.source = source
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class PageFetcher:
+    """Fetches pages over one pooled session and caches successful responses on disk"""
+
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL, max_bytes=int(PAGE_CACHE_MAX_MB * 1e6),
+                 session=None, timeout=REQUEST_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = session or self._new_session()
+        # Eviction scans the whole directory; one at a time is enough
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _new_session():
+        """A session whose connections are kept alive and reused across requests"""
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".body"
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None, None
+        # Recently used pages are evicted last
+        os.utime(body_path)
+        return meta, content
+
+    def _store(self, url, meta, content=None):
+        meta_path, body_path = self._paths(url)
+        if content is not None:
+            _atomic_write(body_path, content)
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _evict(self):
+        """Delete least recently used pages until the bodies fit in max_bytes"""
+        with self._evict_lock:
+            bodies = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".body"):
+                    try:
+                        stat = os.stat(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        continue
+                    bodies.append((stat.st_mtime, stat.st_size, name[: -len(".body")]))
+            total = sum(size for _, size, _ in bodies)
+            for _, size, key in sorted(bodies):
+                if total <= self.max_bytes:
+                    break
+                for suffix in (".json", ".body"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, key + suffix))
+                    except OSError:
+                        pass
+                total -= size
+
+    def fetch(self, url):
+        """Fetch a page, from the cache when possible. Network errors propagate as requests exceptions."""
+        meta, content = self._load(url)
+        if meta is not None and time.time() - meta["fetched_at"] < self.ttl:
+            return Page(meta["url"], 200, content, meta["encoding"], "cache")
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        response = self.session.get(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+
+        if response.status_code == 304 and meta is not None:
+            meta["fetched_at"] = time.time()
+            self._store(url, meta)
+            return Page(meta["url"], 200, content, meta["encoding"], "revalidated")
+
+        # Detected from the body like WebBaseLoader does, and stored so cache hits skip it
+        encoding = response.apparent_encoding if response.content else response.encoding
+        page = Page(response.url, response.status_code, response.content, encoding, "network")
+        no_store = "no-store" in response.headers.get("Cache-Control", "").lower()
+        if response.status_code == 200 and not no_store and len(response.content) <= self.max_bytes:
+            self._store(url, {
+                "url": response.url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "encoding": encoding,
+                "fetched_at": time.time(),
+            }, response.content)
+            self._evict()
+        return page
@@ -1,5 +1,4 @@
 import streamlit as st
-from langchain_community.document_loaders import WebBaseLoader
 import time
 import requests
 from urllib.parse import urlparse
@@ -7,7 +6,8 @@ import re
 
 from chains import Chain #class
 from portfolio import Portfolio #class
-from utils import clean_text  #function
+from fetch import PageFetcher #class
+from utils import clean_text, extract_text, LatencyLog  #function, function, class
 
 
 def validate_url(url):
@@ -19,32 +19,29 @@ def validate_url(url):
         return False
 
 
-def check_url_accessibility(url):
-    """Check if the URL is accessible and returns proper response"""
+def fetch_page(fetcher, url):
+    """Fetch the page once and check its status; returns (page, message), page is None on failure"""
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10, allow_redirects=True)
+        page = fetcher.fetch(url)
         
-        if response.status_code == 404:
-            return False, "Page not found (404 error)"
-        elif response.status_code == 403:
-            return False, "Access forbidden (403 error)"
-        elif response.status_code >= 500:
-            return False, f"Server error ({response.status_code})"
-        elif response.status_code != 200:
-            return False, f"HTTP error {response.status_code}"
+        if page.status_code == 404:
+            return None, "Page not found (404 error)"
+        elif page.status_code == 403:
+            return None, "Access forbidden (403 error)"
+        elif page.status_code >= 500:
+            return None, f"Server error ({page.status_code})"
+        elif page.status_code != 200:
+            return None, f"HTTP error {page.status_code}"
         else:
-            return True, "URL is accessible"
+            return page, "URL is accessible"
     except requests.exceptions.ConnectionError:
-        return False, "Connection error - unable to reach the website"
+        return None, "Connection error - unable to reach the website"
     except requests.exceptions.Timeout:
-        return False, "Request timeout - website took too long to respond"
+        return None, "Request timeout - website took too long to respond"
     except requests.exceptions.InvalidURL:
-        return False, "Invalid URL format"
+        return None, "Invalid URL format"
     except Exception as e:
-        return False, f"Network error: {str(e)}"
+        return None, f"Network error: {str(e)}"
 
 
 def add_custom_css():
@@ -155,6 +152,52 @@ def show_error_message(error_type, message, details=""):
         """, unsafe_allow_html=True)
 
 
+@st.cache_resource(show_spinner="🚀 Loading models...")
+def load_resources():
+    """Create the LLM chain and the portfolio once per process; every rerun and session shares them"""
+    timings = {}
+    start = time.perf_counter()
+    chain = Chain()
+    timings["LLM client"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    portfolio = Portfolio()
+    portfolio.load_portfolio()
+    timings["Portfolio (CSV, model, index)"] = time.perf_counter() - start
+
+    # Warm-up: the first encode and search pay for lazy initialisation in torch and FAISS
+    start = time.perf_counter()
+    portfolio.query_links(["Python"])
+    timings["Warm-up query"] = time.perf_counter() - start
+    return chain, portfolio, timings
+
+
+@st.cache_resource
+def page_fetcher():
+    """One pooled HTTP session and disk page cache per process"""
+    return PageFetcher()
+
+
+@st.cache_resource
+def latency_log():
+    """Form-submit latencies of this process, shared by all sessions"""
+    return LatencyLog()
+
+
+def show_performance(boot_timings, rerun_seconds):
+    """Show boot, rerun and interaction timings in the sidebar"""
+    with st.sidebar.expander("⏱️ Performance"):
+        st.markdown("**Boot (once per process)**")
+        for name, seconds in boot_timings.items():
+            st.markdown(f"- {name}: {seconds:.2f}s")
+        st.markdown(f"**This rerun:** resources ready in {rerun_seconds * 1000:.1f} ms")
+        first, median, repeats = latency_log().summary()
+        if first is not None:
+            st.markdown(f"**First interaction:** {first:.1f}s")
+        if repeats:
+            st.markdown(f"**Repeat interactions:** median {median:.1f}s over {repeats}")
+
+
 def create_streamlit_app(llm, portfolio, clean_text):
     st.title("📧 Cold Mail Generator")
     
@@ -168,112 +211,127 @@ def create_streamlit_app(llm, portfolio, clean_text):
         
         # This will trigger when user hits Enter OR clicks the button
         if submit_button:
-            # Validate URL format first
-            if not url_input.strip():
-                show_error_message("error", "Please enter a URL", "The URL field cannot be empty.")
-                return
-            
-            if not validate_url(url_input):
-                show_error_message("error", "Invalid URL Format", 
-                                "Please enter a valid URL starting with http:// or https://")
+            started = time.perf_counter()
+            process_url(url_input, llm, portfolio, clean_text)
+            elapsed = time.perf_counter() - started
+            latency_log().record(elapsed)
+            st.caption(f"⏱️ Processed in {elapsed:.1f}s")
+
+
+def process_url(url_input, llm, portfolio, clean_text):
+    """Validate the URL, extract the jobs on the page and write an email for each"""
+    # Validate URL format first
+    if not url_input.strip():
+        show_error_message("error", "Please enter a URL", "The URL field cannot be empty.")
+        return
+    
+    if not validate_url(url_input):
+        show_error_message("error", "Invalid URL Format", 
+                        "Please enter a valid URL starting with http:// or https://")
+        return
+    
+    # Create a placeholder for the loading animation
+    loading_placeholder = st.empty()
+    
+    try:
+        # Show loading animation
+        with loading_placeholder.container():
+            show_loading_animation()
+        
+        # Step 1: Fetch the page once (or reuse it from the page cache) and check its status
+        with st.spinner("🔍 Checking URL accessibility..."):
+            page, accessibility_message = fetch_page(page_fetcher(), url_input)
+            if page is None:
+                loading_placeholder.empty()
+                show_error_message("error", "URL Not Accessible", accessibility_message)
                 return
-            
-            # Create a placeholder for the loading animation
-            loading_placeholder = st.empty()
-            
+        
+        # Step 2: Loading webpage from the response fetched above
+        with st.spinner("📥 Loading webpage..."):
             try:
-                # Show loading animation
-                with loading_placeholder.container():
-                    show_loading_animation()
-                
-                # Step 1: Check URL accessibility
-                with st.spinner("🔍 Checking URL accessibility..."):
-                    is_accessible, accessibility_message = check_url_accessibility(url_input)
-                    if not is_accessible:
-                        loading_placeholder.empty()
-                        show_error_message("error", "URL Not Accessible", accessibility_message)
-                        return
+                text = extract_text(page.text)
                 
-                # Step 2: Loading webpage
-                with st.spinner("📥 Loading webpage..."):
-                    try:
-                        loader = WebBaseLoader([url_input])
-                        documents = loader.load()
-                        
-                        if not documents:
-                            loading_placeholder.empty()
-                            show_error_message("error", "No Content Found", 
-                                            "The webpage appears to be empty or inaccessible.")
-                            return
-                        
-                        data = clean_text(documents[0].page_content)
-                        
-                        if not data or len(data.strip()) < 50:
-                            loading_placeholder.empty()
-                            show_error_message("warning", "Limited Content Found", 
-                                            "The webpage content seems too short to extract job information.")
-                            return
-                            
-                    except Exception as e:
-                        loading_placeholder.empty()
-                        if "404" in str(e).lower():
-                            show_error_message("error", "Page Not Found (404)", 
-                                            "The URL you provided doesn't exist or has been moved.")
-                        elif "403" in str(e).lower():
-                            show_error_message("error", "Access Forbidden (403)", 
-                                            "The website is blocking access to this page.")
-                        elif "timeout" in str(e).lower():
-                            show_error_message("error", "Request Timeout", 
-                                            "The website took too long to respond.")
-                        else:
-                            show_error_message("error", "Failed to Load Webpage", 
-                                            f"Error: {str(e)}")
-                        return
+                if not text.strip():
+                    loading_placeholder.empty()
+                    show_error_message("error", "No Content Found", 
+                                    "The webpage appears to be empty or inaccessible.")
+                    return
                 
-                # Step 3: Extracting job information
-                with st.spinner("🔍 Extracting job information..."):
-                    try:
-                        jobs = llm.extract_jobs(data)
-                    except Exception as e:
-                        loading_placeholder.empty()
-                        show_error_message("error", "Failed to Extract Job Information", 
-                                        f"Error processing the webpage content: {str(e)}")
-                        return
+                data = clean_text(text)
                 
-                # Clear loading animation
-                loading_placeholder.empty()
-                
-                # Step 4: Generate emails with progress
-                if jobs and len(jobs) > 0:
-                    st.success(f"✅ Found {len(jobs)} job(s) to process")
-                    
-                    for i, job in enumerate(jobs, 1):
-                        with st.spinner(f"📧 Generating email {i}/{len(jobs)}..."):
-                            try:
-                                skills = job.get('skills', [])
-                                links = portfolio.query_links(skills)
-                                email = llm.write_mail(job, links)
-                                
-                                # Display the email with a nice header
-                                st.markdown(f"### 📧 Generated Email {i}")
-                                st.code(email, language='markdown')
-                                st.divider()
-                            except Exception as e:
-                                st.error(f"❌ Failed to generate email {i}: {str(e)}")
-                else:
-                    show_error_message("warning", "No Jobs Found", 
-                                    "No job postings were detected on this webpage. Please try a different URL that contains job listings.")
+                if not data or len(data.strip()) < 50:
+                    loading_placeholder.empty()
+                    show_error_message("warning", "Limited Content Found", 
+                                    "The webpage content seems too short to extract job information.")
+                    return
                     
             except Exception as e:
                 loading_placeholder.empty()
-                show_error_message("error", "Unexpected Error", 
-                                f"An unexpected error occurred: {str(e)}")
+                show_error_message("error", "Failed to Load Webpage", 
+                                f"Error: {str(e)}")
+                return
+        
+        # Step 3: Extracting job information
+        with st.spinner("🔍 Extracting job information..."):
+            try:
+                jobs = llm.extract_jobs(data)
+            except Exception as e:
+                loading_placeholder.empty()
+                show_error_message("error", "Failed to Extract Job Information", 
+                                f"Error processing the webpage content: {str(e)}")
+                return
+        
+        # Clear loading animation
+        loading_placeholder.empty()
+        
+        # Step 4: Generate emails with progress
+        if jobs and len(jobs) > 0:
+            st.success(f"✅ Found {len(jobs)} job(s) to process")
+            
+            # Match every job against the portfolio in one batched encode/search
+            with st.spinner("🎯 Matching portfolio items..."):
+                try:
+                    links_per_job = portfolio.query_links_batch([job.get('skills', []) for job in jobs])
+                except Exception as e:
+                    show_error_message("error", "Failed to Match Portfolio",
+                                    f"Error searching the portfolio: {str(e)}")
+                    return
+            
+            # One slot per job, in page order; each is filled as soon as its email is ready
+            slots = [st.empty() for _ in jobs]
+            for i, slot in enumerate(slots, 1):
+                slot.info(f"⏳ Writing email {i}...")
+            
+            done = 0
+            progress = st.progress(0.0, text=f"📧 Generating {len(jobs)} email(s)...")
+            for position, email, error in llm.write_mails(zip(jobs, links_per_job)):
+                i = position + 1
+                with slots[position].container():
+                    if error is None:
+                        # Display the email with a nice header
+                        st.markdown(f"### 📧 Generated Email {i}")
+                        st.code(email, language='markdown')
+                        st.divider()
+                    else:
+                        st.error(f"❌ Failed to generate email {i}: {str(error)}")
+                done += 1
+                progress.progress(done / len(jobs), text=f"📧 Generated {done}/{len(jobs)} email(s)")
+            progress.empty()
+        else:
+            show_error_message("warning", "No Jobs Found", 
+                            "No job postings were detected on this webpage. Please try a different URL that contains job listings.")
+            
+    except Exception as e:
+        loading_placeholder.empty()
+        show_error_message("error", "Unexpected Error", 
+                        f"An unexpected error occurred: {str(e)}")
 
 
 if __name__ == "__main__":
-    chain = Chain()
-    portfolio = Portfolio()
     st.set_page_config(layout="wide", page_title="Cold Email Generator", page_icon="📧")
+    rerun_start = time.perf_counter()
+    chain, portfolio, boot_timings = load_resources()
+    show_performance(boot_timings, time.perf_counter() - rerun_start)
     create_streamlit_app(chain, portfolio, clean_text)
 
 
@@ -5,6 +5,7 @@ import os
 from sentence_transformers import SentenceTransformer
 import faiss
 import uuid
+import threading
 
 class Portfolio:
     def __init__(self, file_path="ColdEmailGenerator/resources/my_portfolio.csv"):
@@ -16,6 +17,8 @@ class Portfolio:
         
         # Initialize sentence transformer for embeddings
         self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # One Portfolio is shared by all Streamlit sessions; guards the lazy index build
+        self._lock = threading.Lock()
         
         # Create vectorstore directory if it doesn't exist
         os.makedirs(self.vectorstore_path, exist_ok=True)
@@ -41,54 +44,91 @@ class Portfolio:
 
     def load_portfolio(self):
         """Load portfolio data into FAISS index"""
-        if self.index is None:
-            # Create embeddings for all tech stacks
-            tech_stacks = self.data["Techstack"].tolist()
-            embeddings = self.model.encode(tech_stacks, show_progress_bar=True)
-            
-            # Initialize FAISS index
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
-            
-            # Add embeddings to index
-            self.index.add(embeddings.astype('float32'))
-            
-            # Store metadata (links) corresponding to each embedding
-            self.metadata = self.data["Links"].tolist()
-            
-            # Save index and metadata
-            faiss.write_index(self.index, self.index_path)
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
-            
-            # print(f"Created FAISS index with {len(tech_stacks)} portfolio items")
+        with self._lock:
+            if self.index is None:
+                self._build_index()
+
+    def _build_index(self):
+        """Embed the tech stacks, build the FAISS index and save it with its metadata"""
+        # Create embeddings for all tech stacks
+        tech_stacks = self.data["Techstack"].tolist()
+        embeddings = self.model.encode(tech_stacks, show_progress_bar=True)
+        
+        # Initialize FAISS index
+        dimension = embeddings.shape[1]
+        index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
+        
+        # Add embeddings to index
+        index.add(embeddings.astype('float32'))
+        
+        # Store metadata (links) corresponding to each embedding
+        self.metadata = self.data["Links"].tolist()
+        # Published last, so concurrent queries never see a half-built index
+        self.index = index
+        
+        # Save index and metadata
+        faiss.write_index(self.index, self.index_path)
+        with open(self.metadata_path, 'wb') as f:
+            pickle.dump(self.metadata, f)
+        
+        # print(f"Created FAISS index with {len(tech_stacks)} portfolio items")
+
+    @staticmethod
+    def _query_text(skills):
+        """Convert a skills list to a single query string"""
+        if isinstance(skills, list):
+            return ", ".join(skills)
+        return str(skills)
 
     def query_links(self, skills, n_results=2):
         """Query portfolio based on skills and return relevant links"""
+        return self.query_links_batch([skills], n_results)[0]
+
+    def query_links_batch(self, skills_list, n_results=2):
+        """Query portfolio for many jobs at once; returns one list of links per entry of skills_list"""
         if self.index is None:
             print("No FAISS index found. Loading portfolio...")
             self.load_portfolio()
         
-        # Convert skills list to a single query string
-        if isinstance(skills, list):
-            query_text = ", ".join(skills)
-        else:
-            query_text = str(skills)
+        query_texts = [self._query_text(skills) for skills in skills_list]
+        # Identical skill sets are encoded and searched once
+        unique_texts = list(dict.fromkeys(query_texts))
+        if not unique_texts:
+            return []
         
-        # Create embedding for the query
-        query_embedding = self.model.encode([query_text])
+        # One batched forward pass for all queries
+        query_embeddings = self.model.encode(unique_texts, batch_size=64)
         
-        # Search the index
-        scores, indices = self.index.search(query_embedding.astype('float32'), n_results)
+        # One matrix search for all queries
+        scores, indices = self.index.search(query_embeddings.astype('float32'), n_results)
         
-        # Return metadata (links) for the top results
-        results = []
-        for idx in indices[0]:
-            if idx < len(self.metadata):
-                results.append({"links": self.metadata[idx]})
+        # Metadata (links) for the top results of each query; -1 pads when n_results > index size
+        links_by_text = {}
+        for text, row in zip(unique_texts, indices):
+            links_by_text[text] = [{"links": self.metadata[idx]} for idx in row if 0 <= idx < len(self.metadata)]
         
-        return results
+        return [list(links_by_text[text]) for text in query_texts]
 
 if __name__ == "__main__":
+    import time
+
     portfolio = Portfolio()
-    portfolio.load_portfolio()
\ No newline at end of file
+    portfolio.load_portfolio()
+
+    # A career page with 50 postings: one query per job vs. one batched query
+    stacks = [stack.split(",") for stack in portfolio.data["Techstack"].tolist()]
+    skills_list = [stacks[i % len(stacks)][: 1 + i % 3] for i in range(50)]
+    portfolio.query_links(["Python"])  # warm-up
+
+    start = time.perf_counter()
+    looped = [portfolio.query_links(skills) for skills in skills_list]
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = portfolio.query_links_batch(skills_list)
+    batch_seconds = time.perf_counter() - start
+
+    # Padding in a batch can shift embeddings by float rounding, so near-ties may reorder
+    same = sum(a == b for a, b in zip(looped, batched))
+    print(f"{len(skills_list)} jobs: loop {loop_seconds * 1000:.1f} ms, batch {batch_seconds * 1000:.1f} ms "
+          f"({loop_seconds / batch_seconds:.1f}x), same links for {same}/{len(skills_list)}")
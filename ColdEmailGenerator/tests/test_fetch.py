@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fetch import PageFetcher
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves /etag, /modified, /no-store and /size/<n>; counts requests per path"""
+
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        headers = {}
+        if self.path == "/etag":
+            headers["ETag"] = ETAG
+            if self.headers.get("If-None-Match") == ETAG:
+                return self._send(304, b"", headers)
+        elif self.path == "/modified":
+            headers["Last-Modified"] = LAST_MODIFIED
+            if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                return self._send(304, b"", headers)
+        elif self.path == "/no-store":
+            headers["Cache-Control"] = "no-store"
+        elif self.path.startswith("/size/"):
+            return self._send(200, b"x" * int(self.path.rsplit("/", 1)[1]), headers)
+        self._send(200, f"<html><body>Jobs at {self.path}</body></html>".encode("utf-8"), headers)
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.hits = {}
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_fresh_entry_is_served_from_cache_without_a_request(server, tmp_path):
+    fetcher = PageFetcher(cache_dir=str(tmp_path), ttl=60)
+
+    first = fetcher.fetch(url(server, "/etag"))
+    second = fetcher.fetch(url(server, "/etag"))
+
+    assert first.source == "network"
+    assert second.source == "cache"
+    assert second.status_code == 200
+    assert second.text == first.text
+    assert server.hits["/etag"] == 1
+
+
+@pytest.mark.parametrize("path", ["/etag", "/modified"])
+def test_expired_entry_is_revalidated_with_a_conditional_request(server, tmp_path, path):
+    PageFetcher(cache_dir=str(tmp_path), ttl=60).fetch(url(server, path))
+    expired = PageFetcher(cache_dir=str(tmp_path), ttl=0)
+
+    page = expired.fetch(url(server, path))
+
+    assert page.source == "revalidated"
+    assert page.status_code == 200
+    assert "Jobs at " + path in page.text
+    assert server.hits[path] == 2
+
+
+def test_no_store_response_is_not_cached(server, tmp_path):
+    fetcher = PageFetcher(cache_dir=str(tmp_path), ttl=60)
+
+    first = fetcher.fetch(url(server, "/no-store"))
+    second = fetcher.fetch(url(server, "/no-store"))
+
+    assert first.source == second.source == "network"
+    assert server.hits["/no-store"] == 2
+    assert os.listdir(tmp_path) == []
+
+
+def test_lru_eviction_keeps_bodies_under_max_bytes(server, tmp_path):
+    fetcher = PageFetcher(cache_dir=str(tmp_path), ttl=60, max_bytes=2500)
+
+    fetcher.fetch(url(server, "/size/1000"))
+    time.sleep(0.05)
+    fetcher.fetch(url(server, "/size/1001"))
+    time.sleep(0.05)
+    # A cache hit makes /size/1000 the most recently used page
+    assert fetcher.fetch(url(server, "/size/1000")).source == "cache"
+    time.sleep(0.05)
+    fetcher.fetch(url(server, "/size/1002"))
+
+    bodies = [name for name in os.listdir(tmp_path) if name.endswith(".body")]
+    assert sum(os.path.getsize(os.path.join(tmp_path, name)) for name in bodies) <= 2500
+    assert fetcher.fetch(url(server, "/size/1000")).source == "cache"
+    assert fetcher.fetch(url(server, "/size/1002")).source == "cache"
+    assert fetcher.fetch(url(server, "/size/1001")).source == "network"
@@ -1,4 +1,8 @@
 import re
+import threading
+from collections import deque
+
+from bs4 import BeautifulSoup
 
 def clean_text(text):
     # Remove HTML tags
@@ -13,4 +17,79 @@ def clean_text(text):
     text = text.strip()
     # Remove extra whitespace
     text = ' '.join(text.split())
-    return text
\ No newline at end of file
+    return text
+
+
+# Gemini has no local tokenizer; about 4 characters per token is close enough for English text
+CHARS_PER_TOKEN = 4
+# Postings on a career page usually end with an "Apply" button
+POSTING_END_WORDS = {"apply"}
+
+
+def estimate_tokens(text):
+    """Rough token count of a text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_segments(text, max_tokens, overlap_tokens):
+    """Split cleaned text into segments of at most about max_tokens.
+
+    A cut is moved back to the end of a posting when there is one in the last quarter of the
+    segment. When there is none, the next segment starts overlap_tokens earlier so that the
+    posting cut in two is also seen whole.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    words = text.split()
+    budget = max_tokens * CHARS_PER_TOKEN
+    overlap = min(overlap_tokens * CHARS_PER_TOKEN, budget // 2)
+    segments = []
+    start = 0
+    while start < len(words):
+        end, size = start, 0
+        while end < len(words) and (end == start or size + len(words[end]) + 1 <= budget):
+            size += len(words[end]) + 1
+            end += 1
+        segments.append(words[start:end])
+        if end == len(words):
+            break
+        floor = start + (end - start) * 3 // 4
+        boundary = next((i + 1 for i in range(end - 1, floor - 1, -1) if words[i].lower() in POSTING_END_WORDS), None)
+        if boundary is not None:
+            segments[-1] = words[start:boundary]
+            start = boundary
+            continue
+        back, size = end, 0
+        while back > start + 1 and size + len(words[back - 1]) + 1 <= overlap:
+            back -= 1
+            size += len(words[back]) + 1
+        start = back
+    return [' '.join(segment) for segment in segments]
+
+
+def extract_text(html):
+    """Visible text of an HTML page, as WebBaseLoader extracts it"""
+    return BeautifulSoup(html, "html.parser").get_text()
+
+
+class LatencyLog:
+    """Thread-safe record of request latencies: the first one, then the most recent repeats"""
+
+    def __init__(self, max_repeats=1000):
+        self._lock = threading.Lock()
+        self.first = None
+        self.repeats = deque(maxlen=max_repeats)
+
+    def record(self, seconds):
+        with self._lock:
+            if self.first is None:
+                self.first = seconds
+            else:
+                self.repeats.append(seconds)
+
+    def summary(self):
+        """Return (first, median of repeats, number of repeats)"""
+        with self._lock:
+            repeats = sorted(self.repeats)
+        median = repeats[len(repeats) // 2] if repeats else None
+        return self.first, median, len(repeats)
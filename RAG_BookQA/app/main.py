@@ -1,13 +1,32 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+import hmac
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from rag.chain import ask_question, build_conversational_chain
+from rag import metrics
+from rag.answer_cache import SemanticAnswerCache
 from rag.config import load_settings
-from rag.vectorstore import load_faiss_index
+
+# The LangChain stack (rag.chain, rag.llm, rag.memory, rag.shards) takes seconds to
+# import, so it is imported by the background loader, not here; handlers import
+# from it only once the app is ready.
+if TYPE_CHECKING:
+    from langchain.chains import ConversationalRetrievalChain
+
+    from rag.memory import ConversationHistory
+
+_IMPORTED_AT = time.perf_counter()
 
 
 class AskRequest(BaseModel):
@@ -15,41 +34,487 @@ class AskRequest(BaseModel):
     language: Optional[str] = Field(
         default="auto", description="Preferred answer language: auto|en|bn"
     )
+    use_cache: bool = Field(
+        default=True, description="Set to false to bypass the semantic answer cache"
+    )
+    session_id: Optional[str] = Field(
+        default=None, description="Conversation id; omit for a stateless question"
+    )
+    book: Optional[str] = Field(
+        default=None, description="Search only this book (file name, path under data/pdfs or shard)"
+    )
+    collection: Optional[str] = Field(
+        default=None, description="Search only this collection (subfolder of data/pdfs)"
+    )
 
 
 class AskResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
+    cached: bool = False
+    session_id: Optional[str] = None
+    path: str = Field(
+        default="no_history",
+        description="no_history|standalone|condensed: how the question reached retrieval",
+    )
+
+
+class BatchQuestion(BaseModel):
+    id: Optional[Any] = Field(default=None, description="Echoed back; defaults to the position")
+    question: str
+    language: Optional[str] = "auto"
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[BatchQuestion]
+    use_cache: bool = Field(
+        default=True, description="Store the answers in the semantic answer cache (pre-warming)"
+    )
+    book: Optional[str] = Field(default=None, description="Search only this book")
+    collection: Optional[str] = Field(default=None, description="Search only this collection")
 
 
 app = FastAPI(title="RAG Book QA", version="1.0.0")
+# Requests per retrieval path, to measure how many condense calls are skipped
+path_counts: Counter = Counter()
+
+# None until the background loader has built it; replaced whole on reload, so a
+# request keeps the chain it started with
+chain: Optional[ConversationalRetrievalChain] = None
+load_error: Optional[str] = None
+startup_timings: Dict[str, float] = {}
+last_reload: Optional[Dict[str, Any]] = None
+# One reload at a time; requests never wait on it
+_reload_lock = threading.Lock()
+_background: List[Any] = []
+
+
+def _build_chain(previous: Optional[ConversationalRetrievalChain] = None) -> ConversationalRetrievalChain:
+    from rag.chain import build_conversational_chain
+    from rag.shards import load_retriever
+
+    retriever = load_retriever(settings, previous.retriever if previous is not None else None)
+    return build_conversational_chain(settings, retriever=retriever)
+
+
+def _load_app() -> None:
+    # Runs in a worker thread while the server already answers /health and /ready
+    global chain, sessions, summary_llm, load_error
+    started = time.perf_counter()
+    try:
+        from rag.chain import SUMMARY_TAG
+        from rag.llm import create_llm
+        from rag.memory import SessionStore
+
+        imported = time.perf_counter()
+        sessions = SessionStore(
+            settings.session_max_entries,
+            settings.session_idle_ttl,
+            settings.history_token_budget,
+        )
+        summary_llm = create_llm(settings, tags=[SUMMARY_TAG]) if settings.history_summary else None
+        new_chain = _build_chain()
+    except FileNotFoundError:
+        load_error = "FAISS index is missing. Run the ingestion first: python -m scripts.ingest_pdfs"
+        return
+    except Exception as e:  # noqa: BLE001
+        load_error = f"{type(e).__name__}: {e}"
+        return
+    loaded = time.perf_counter()
+    startup_timings.update(
+        {
+            "import_seconds": imported - started,
+            "index_load_seconds": loaded - imported,
+            "ready_seconds": loaded - _IMPORTED_AT,
+        }
+    )
+    metrics.record("startup", loaded - _IMPORTED_AT)
+    chain = new_chain
+
+
+def reload_index(force: bool = False) -> Dict[str, Any]:
+    # Loads the index on disk next to the one being served, then swaps the chain.
+    # Requests in flight finish on the old chain; its index is freed after them.
+    # Also recovers an app whose first load failed (e.g. ingestion had not run yet).
+    global chain, last_reload, load_error
+    with _reload_lock:
+        from rag.shards import current_index_version
+
+        old = chain
+        previous = old.retriever.index_version if old is not None else None
+        if not force and current_index_version(settings) == previous:
+            return {"reloaded": False, "index_version": previous}
+        started = time.perf_counter()
+        new_chain = _build_chain(old)
+        loaded = time.perf_counter()
+        chain = new_chain
+        swapped = time.perf_counter()
+        load_error = None
+        metrics.record("index_reload", loaded - started)
+        last_reload = {
+            "reloaded": True,
+            "index_version": new_chain.retriever.index_version,
+            "previous_version": previous,
+            "load_seconds": loaded - started,
+            "swap_seconds": swapped - loaded,
+            "at": time.time(),
+        }
+        return last_reload
+
+
+async def _watch_index() -> None:
+    # Polls the index version on disk. A new version must stay the same for one more
+    # interval before it is loaded, so a running ingestion's checkpoints are skipped.
+    from rag.shards import current_index_version
+
+    pending: Optional[str] = None
+    while True:
+        await asyncio.sleep(settings.index_watch_interval)
+        current = chain
+        if current is None and load_error is None:
+            continue  # first load still running
+        try:
+            version = await run_in_threadpool(current_index_version, settings)
+            if not version or (current is not None and version == current.retriever.index_version):
+                pending = None
+            elif version != pending:
+                pending = version
+            else:
+                pending = None
+                await run_in_threadpool(reload_index)
+        except Exception as e:  # noqa: BLE001
+            # Keep serving the current index; the next poll tries again
+            print(f"Index reload failed: {type(e).__name__}: {e}")
 
 
 @app.on_event("startup")
-def _on_startup() -> None:
-    global chain
+async def _on_startup() -> None:
+    # Only settings and in-memory caches here; the index loads in the background.
+    # Not ready until it has: a lifespan started again in the same process (tests,
+    # benchmarks) must not serve the index it loaded last time.
+    global settings, answer_cache, chain, load_error
+    chain, load_error = None, None
     settings = load_settings()
+    metrics.configure(settings.metrics_enabled)
+    answer_cache = SemanticAnswerCache(
+        settings.answer_cache_size,
+        settings.answer_cache_ttl,
+        settings.answer_cache_threshold,
+    )
+    loop = asyncio.get_running_loop()
+    _background.append(loop.run_in_executor(None, _load_app))
+    if settings.index_watch_interval > 0:
+        _background.append(asyncio.create_task(_watch_index()))
+
+
+def _ready_chain() -> ConversationalRetrievalChain:
+    current = chain
+    if current is None:
+        detail = load_error or "The index is still loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    return current
+
+
+@app.middleware("http")
+async def _timing(request: Request, call_next) -> Response:
+    if not metrics.enabled():
+        return await call_next(request)
+    token = metrics.start_request()
+    started = time.perf_counter()
     try:
-        vs = load_faiss_index(settings)
-    except Exception as e:  # noqa: BLE001
-        raise RuntimeError(
-            "FAISS index is missing. Run the ingestion first: python -m scripts.ingest_pdfs"
-        ) from e
-    chain = build_conversational_chain(settings, vs)
+        response = await call_next(request)
+    finally:
+        timings = metrics.end_request(token)
+    total = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe((getattr(route, "path", "unmatched"),), total)
+    # Streaming responses send headers before the work happens, so they carry only
+    # the stages that ran before the first byte
+    response.headers["Server-Timing"] = metrics.server_timing({**timings, "total": total})
+    return response
 
 
-@app.post("/ask", response_model=AskResponse)
-def ask(request: AskRequest) -> AskResponse:
+def _session(request: AskRequest) -> Optional[ConversationHistory]:
+    return sessions.get(request.session_id) if request.session_id else None
+
+
+def _chat_history(request: AskRequest, history: Optional[ConversationHistory]):
+    from rag.chain import select_history
+
+    messages = history.messages() if history is not None else []
+    chat_history, path = select_history(request.question, messages, settings.condense_mode)
+    path_counts[path] += 1
+    return chat_history, path
+
+
+async def _fold_evicted(history: Optional[ConversationHistory]) -> None:
+    # Turns trimmed from the history are summarized if enabled, otherwise dropped
+    from rag.memory import asummarize_evicted
+
+    if history is None:
+        return
+    if summary_llm is not None:
+        await asummarize_evicted(summary_llm, history)
+    else:
+        history.take_evicted()
+
+
+def _chain_for(request) -> ConversationalRetrievalChain:
+    from rag.chain import scoped_chain
+
+    try:
+        return scoped_chain(_ready_chain(), request.book, request.collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+
+
+async def _cache_lookup(
+    qa_chain: ConversationalRetrievalChain, request: AskRequest, lang: str, chat_history: List
+):
+    # Returns (embedding, hit); embedding is None when the cache is not consulted.
+    # Follow-ups depend on their conversation, so only standalone questions are cached.
+    # The query embedding is a blocking call, so it runs off the event loop.
+    # A scoped chain's index_version names its shards, so filtered answers stay apart.
+    if chat_history or not (request.use_cache and answer_cache.enabled):
+        return None, None
+    retriever = qa_chain.retriever
+    embedding = await run_in_threadpool(retriever.embed_query, request.question)
+    return embedding, answer_cache.lookup(embedding, lang, retriever.index_version)
+
+
+def _prepare(request: AskRequest) -> Tuple[ConversationalRetrievalChain, str]:
     if not request.question.strip():
         raise HTTPException(status_code=400, detail="Question must not be empty")
-    question_text = request.question
-    lang = (request.language or "auto").lower()
-    if lang == "en":
-        question_text = "Please answer in English.\n" + question_text
-    elif lang in {"bn", "bangla", "bengali"}:
-        question_text = "অনুগ্রহ করে বাংলায় উত্তর দিন।\n" + question_text
+    qa_chain = _chain_for(request)
+    # Handlers import rag.chain only after this readiness check: while the loader is
+    # still importing it, an import here would block the event loop
+    from rag.chain import normalize_language
+
+    return qa_chain, normalize_language(request.language)
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(request: AskRequest, background: BackgroundTasks) -> AskResponse:
+    qa_chain, lang = _prepare(request)
+    from rag.chain import aask_question, localize_question
+
+    history = _session(request)
+    chat_history, path = _chat_history(request, history)
+    embedding, hit = await _cache_lookup(qa_chain, request, lang, chat_history)
+    if hit is not None:
+        answer, sources, cached = hit.answer, hit.sources, True
+    else:
+        answer, sources = await aask_question(
+            qa_chain, localize_question(request.question, lang), chat_history
+        )
+        cached = False
+        if embedding is not None:
+            answer_cache.store(embedding, lang, qa_chain.retriever.index_version, answer, sources)
+    if history is not None:
+        history.add_turn(request.question, answer)
+    # Summarizing evicted turns happens after the response is sent
+    background.add_task(_fold_evicted, history)
+    return AskResponse(
+        answer=answer, sources=sources, cached=cached, session_id=request.session_id, path=path
+    )
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest) -> StreamingResponse:
+    qa_chain, lang = _prepare(request)
+    from rag.chain import astream_answer, localize_question
+
+    history = _session(request)
+    chat_history, path = _chat_history(request, history)
+
+    async def events() -> AsyncIterator[str]:
+        embedding, hit = await _cache_lookup(qa_chain, request, lang, chat_history)
+        if hit is not None:
+            yield _sse("token", {"text": hit.answer})
+            yield _sse("sources", {"sources": hit.sources, "cached": True, "path": path})
+            if history is not None:
+                history.add_turn(request.question, hit.answer)
+            yield _sse("done", {})
+            await _fold_evicted(history)
+            return
+
+        index_version = qa_chain.retriever.index_version
+        parts: List[str] = []
+        try:
+            async for kind, payload in astream_answer(
+                qa_chain, localize_question(request.question, lang), chat_history
+            ):
+                if kind == "token":
+                    parts.append(payload)
+                    yield _sse("token", {"text": payload})
+                else:
+                    if embedding is not None:
+                        answer_cache.store(embedding, lang, index_version, "".join(parts), payload)
+                    yield _sse("sources", {"sources": payload, "cached": False, "path": path})
+        except Exception as e:  # noqa: BLE001
+            # Headers are already sent, so report failures in-band
+            yield _sse("error", {"detail": str(e)})
+            return
+        if history is not None:
+            history.add_turn(request.question, "".join(parts))
+        yield _sse("done", {})
+        await _fold_evicted(history)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask_batch")
+async def ask_batch(request: AskBatchRequest) -> StreamingResponse:
+    # Standalone questions only; results stream back as JSON lines in completion order
+    if any(not q.question.strip() for q in request.questions):
+        raise HTTPException(status_code=400, detail="Questions must not be empty")
+    qa_chain = _chain_for(request)
+    from rag.chain import aanswer_batch, normalize_language
+
+    items = [(q.question, normalize_language(q.language)) for q in request.questions]
+
+    async def lines() -> AsyncIterator[str]:
+        index_version = qa_chain.retriever.index_version
+        stored = set()
+        async for i, answer, sources, error, embedding in aanswer_batch(
+            qa_chain, items, settings.batch_concurrency
+        ):
+            q = request.questions[i]
+            record: Dict[str, Any] = {
+                "id": q.id if q.id is not None else i,
+                "question": q.question,
+                "answer": answer,
+                "sources": sources,
+            }
+            if error is not None:
+                record["error"] = error
+            elif request.use_cache and answer_cache.enabled and items[i] not in stored:
+                stored.add(items[i])
+                # The embedding the batch search computed; no second embedding call
+                answer_cache.store(embedding, items[i][1], index_version, answer, sources)
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/stats")
+def stats() -> Dict[str, Any]:
+    retriever = _ready_chain().retriever
+    return {
+        "retriever_cache": retriever.stats(),
+        "answer_cache": answer_cache.stats(),
+        "sessions": sessions.stats(),
+        "paths": dict(path_counts),
+        "context": retriever.packer.stats() if retriever.packer is not None else None,
+        "startup": startup_timings,
+        "last_reload": last_reload,
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    if not metrics.enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false)")
+    caches = {"answer": answer_cache.stats()}
+    current = chain
+    if current is not None:
+        caches["retriever"] = current.retriever.cache.stats()
+        embeddings = current.retriever.embeddings
+        if hasattr(embeddings, "stats"):
+            caches["embedding"] = embeddings.stats()
+    return PlainTextResponse(metrics.render(caches), media_type="text/plain; version=0.0.4")
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str) -> Dict[str, bool]:
+    _ready_chain()
+    return {"deleted": sessions.drop(session_id)}
+
+
+@app.get("/health")
+def health() -> Dict[str, str]:
+    # Liveness: the process serves requests, whether or not the index is loaded
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    # Readiness: 503 until the index is loaded (or if loading failed)
+    current = chain
+    body: Dict[str, Any] = {"ready": current is not None, "startup": startup_timings}
+    if current is None:
+        body["detail"] = load_error or "The index is still loading"
+        return JSONResponse(body, status_code=503)
+    body["index_version"] = current.retriever.index_version
+    body["last_reload"] = last_reload
+    return JSONResponse(body)
+
+
+def _check_admin_token(x_admin_token: Optional[str]) -> None:
+    # Admin endpoints fail closed: without ADMIN_TOKEN configured they are refused
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not hmac.compare_digest(x_admin_token or "", settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.post("/admin/reload")
+async def admin_reload(
+    force: bool = False, x_admin_token: Optional[str] = Header(default=None)
+) -> Dict[str, Any]:
+    # Picks up a re-ingested index without a restart
+    _check_admin_token(x_admin_token)
+    if chain is None and load_error is None:
+        raise HTTPException(status_code=503, detail="The index is still loading", headers={"Retry-After": "1"})
+    try:
+        return await run_in_threadpool(reload_index, force)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=f"No index to load: {e}") from e
+
+
+def _shard_manager():
+    from rag.shards import ShardedRetriever
+
+    retriever = _ready_chain().retriever
+    if not isinstance(retriever, ShardedRetriever):
+        raise HTTPException(status_code=404, detail="The index is not sharded (SHARD_BY=none)")
+    return retriever.manager
+
+
+@app.get("/shards")
+def list_shards() -> Dict[str, Any]:
+    # The catalog: which books and collections can be used as filters
+    manager = _shard_manager()
+    loaded = set(manager.loaded())
+    return {
+        **manager.stats(),
+        "catalog": {
+            name: {**asdict(info), "loaded": name in loaded} for name, info in sorted(manager.catalog.items())
+        },
+    }
+
 
-    answer, sources = ask_question(chain, question_text)
-    return AskResponse(answer=answer, sources=sources)
+@app.post("/shards/{name}/load")
+async def load_shard(name: str, x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, bool]:
+    _check_admin_token(x_admin_token)
+    manager = _shard_manager()
+    if name not in manager.catalog:
+        raise HTTPException(status_code=404, detail=f"Unknown shard {name!r}")
+    await run_in_threadpool(manager.get, name)
+    return {"loaded": True}
 
 
+@app.post("/shards/{name}/unload")
+def unload_shard(name: str, x_admin_token: Optional[str] = Header(default=None)) -> Dict[str, bool]:
+    _check_admin_token(x_admin_token)
+    return {"unloaded": _shard_manager().unload(name)}
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import List
+
+
+# Words the synthetic books are written in. Only ASCII: the generated PDFs use the
+# built-in Helvetica font, which has no Bangla glyphs.
+VOCABULARY = (
+    "river village monsoon tiger forest boat paddy farmer song mother child rain "
+    "market temple letter journey teacher school bridge harvest festival poet "
+    "king queen palace garden lantern storm island merchant soldier mountain "
+    "remember quietly across beneath silver golden ancient distant gentle bitter"
+).split()
+# For chunking benchmarks only (plain text, no PDF)
+BANGLA_VOCABULARY = (
+    "নদী গ্রাম বর্ষা বাঘ বন নৌকা ধান কৃষক গান মা শিশু বৃষ্টি হাট মন্দির চিঠি যাত্রা "
+    "শিক্ষক বিদ্যালয় সেতু ফসল উৎসব কবি রাজা রানী প্রাসাদ বাগান লণ্ঠন ঝড় দ্বীপ "
+    "বণিক সৈনিক পাহাড় মনে নীরবে পেরিয়ে নিচে রুপালি সোনালি প্রাচীন দূরের কোমল তিক্ত"
+).split()
+LINE_CHARS = 90
+LINES_PER_PAGE = 45
+
+
+def _sentence(rng: random.Random, vocabulary=VOCABULARY, end: str = ".") -> str:
+    words = [rng.choice(vocabulary) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + end
+
+
+def _page_lines(rng: random.Random, vocabulary=VOCABULARY, end: str = ".") -> List[str]:
+    lines: List[str] = []
+    current = ""
+    while len(lines) < LINES_PER_PAGE:
+        sentence = _sentence(rng, vocabulary, end)
+        if len(current) + len(sentence) + 1 > LINE_CHARS:
+            lines.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: List[List[str]]) -> None:
+    # Smallest PDF pypdf extracts text from: one Helvetica text object per page
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in pages:
+        page_id, content_id = len(objects) + 1, len(objects) + 2
+        kids.append(f"{page_id} 0 R")
+        stream = "BT /F1 10 Tf 14 TL 40 760 Td\n" + "".join(f"({_escape(line)}) Tj T*\n" for line in lines) + "ET"
+        data = stream.encode("latin-1")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode("ascii")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode("ascii")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def generate_corpus(pdf_dir: Path, books: int, pages_per_book: int, seed: int = 0) -> List[Path]:
+    rng = random.Random(seed)
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for book in range(books):
+        path = pdf_dir / f"book_{book:03d}.pdf"
+        write_pdf(path, [_page_lines(rng) for _ in range(pages_per_book)])
+        paths.append(path)
+    return paths
+
+
+def generate_page_texts(language: str, pages: int, seed: int = 0) -> List[str]:
+    # Page texts shaped like PDF extraction output: wrapped lines, paragraph breaks
+    rng = random.Random(seed)
+    vocabulary, end = (BANGLA_VOCABULARY, "।") if language == "bn" else (VOCABULARY, ".")
+    texts = []
+    for _ in range(pages):
+        lines = _page_lines(rng, vocabulary, end)
+        for i in range(rng.randint(1, 3)):
+            lines.insert(rng.randrange(1, len(lines)), "")
+        texts.append("\n".join(lines))
+    return texts
+
+
+def generate_questions(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    templates = [
+        "What happens to the {} near the {}?",
+        "Why does the {} remember the {}?",
+        "Describe the {} and the {} in the story.",
+        "Where does the {} meet the {}?",
+    ]
+    questions = []
+    for i in range(count):
+        a, b = rng.sample(VOCABULARY, 2)
+        questions.append(templates[i % len(templates)].format(a, b))
+    return questions
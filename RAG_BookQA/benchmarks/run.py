@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .corpus import generate_corpus, generate_page_texts, generate_questions
+
+
+# Everything runs offline: fake embeddings and LLM, and a throwaway DATA_DIR.
+# These must be set before rag.config.load_settings() is first called.
+OFFLINE_ENV = {
+    "EMBEDDING_PROVIDER": "fake",
+    "LLM_PROVIDER": "fake",
+    "EMBEDDING_CACHE_MAX_ENTRIES": "0",
+    "ANSWER_CACHE_SIZE": "0",
+}
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def _dir_size_mb(directory: Path) -> float:
+    return sum(p.stat().st_size for p in directory.rglob("*") if p.is_file()) / 1e6
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingest(settings, pdf_paths: List[Path]) -> Dict[str, Any]:
+    from rag.loader import iter_chunks, iter_pdf_pages
+    from rag.manifest import make_chunk_id
+    from rag.vectorstore import embed_into_index, load_faiss_index, save_faiss_index
+
+    started = time.perf_counter()
+    files = list(iter_pdf_pages(pdf_paths, settings.load_workers))
+    load_seconds = time.perf_counter() - started
+    pages = sum(len(file_pages) for _, file_pages in files)
+    pdf_mb = sum(path.stat().st_size for path in pdf_paths) / 1e6
+
+    started = time.perf_counter()
+    chunks = []
+    for pdf_path, file_pages in files:
+        for chunk in iter_chunks(settings, file_pages):
+            chunks.append((make_chunk_id(pdf_path.stem, len(chunks)), chunk))
+    split_seconds = time.perf_counter() - started
+
+    vector_store, stats = embed_into_index(settings, None, chunks)
+
+    started = time.perf_counter()
+    save_faiss_index(vector_store, settings.vectorstore_dir, quantization=settings.vector_quantization)
+    save_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    load_faiss_index(settings)
+    open_seconds = time.perf_counter() - started
+
+    return {
+        "files": len(pdf_paths),
+        "pages": pages,
+        "chunks": len(chunks),
+        "load_seconds": load_seconds,
+        "load_pages_per_sec": pages / load_seconds if load_seconds else 0.0,
+        "load_mb_per_sec": pdf_mb / load_seconds if load_seconds else 0.0,
+        "split_seconds": split_seconds,
+        "split_chunks_per_sec": len(chunks) / split_seconds if split_seconds else 0.0,
+        "embed_seconds": stats.seconds,
+        "embed_chunks_per_sec": stats.chunks_per_sec,
+        "index_type": settings.index_type,
+        "vector_quantization": settings.vector_quantization,
+        "index_save_seconds": save_seconds,
+        "index_open_seconds": open_seconds,
+        "index_size_mb": _dir_size_mb(settings.vectorstore_dir),
+    }
+
+
+def _size_summary(tokens: List[int], budget: int) -> Dict[str, float]:
+    sizes = np.asarray(tokens, dtype=np.float64)
+    return {
+        "mean_tokens": float(sizes.mean()),
+        "std_tokens": float(sizes.std()),
+        # Coefficient of variation: how uneven the chunks are, independent of their size
+        "cv": float(sizes.std() / sizes.mean()),
+        "p5_tokens": float(np.percentile(sizes, 5)),
+        "p95_tokens": float(np.percentile(sizes, 95)),
+        "max_tokens": float(sizes.max()),
+        "over_budget": float((sizes > budget).mean()),
+    }
+
+
+def bench_chunking(settings, pages: int, seed: int) -> Dict[str, Any]:
+    # Both chunkers on the same English and Bangla pages: throughput and, measured
+    # in estimated tokens, how evenly sized the chunks come out
+    from dataclasses import replace
+
+    from langchain_core.documents import Document
+
+    from rag.loader import iter_chunks
+    from rag.memory import estimate_tokens
+
+    results: Dict[str, Any] = {}
+    for language in ("en", "bn"):
+        docs = [
+            Document(page_content=text, metadata={"source": f"{language}.pdf", "page": i})
+            for i, text in enumerate(generate_page_texts(language, pages, seed))
+        ]
+        mb = sum(len(doc.page_content.encode("utf-8")) for doc in docs) / 1e6
+        for chunker in ("recursive", "sentence"):
+            chunker_settings = replace(settings, chunker=chunker)
+            started = time.perf_counter()
+            chunks = list(iter_chunks(chunker_settings, docs))
+            seconds = time.perf_counter() - started
+            results.setdefault(language, {})[chunker] = {
+                "chunks": len(chunks),
+                "seconds": seconds,
+                "chunks_per_sec": len(chunks) / seconds if seconds else 0.0,
+                "mb_per_sec": mb / seconds if seconds else 0.0,
+                **_size_summary([estimate_tokens(c.page_content) for c in chunks], settings.chunk_tokens),
+            }
+    return results
+
+
+def bench_ask_question(settings, questions: List[str]) -> Dict[str, Any]:
+    from rag.chain import ask_question, build_conversational_chain
+    from rag.vectorstore import load_faiss_index
+
+    chain = build_conversational_chain(settings, load_faiss_index(settings))
+    latencies = []
+    started = time.perf_counter()
+    for question in questions:
+        t0 = time.perf_counter()
+        ask_question(chain, question)
+        latencies.append(time.perf_counter() - t0)
+    seconds = time.perf_counter() - started
+    return {**_latency_summary(latencies), "questions_per_sec": len(questions) / seconds}
+
+
+async def _bench_api(questions: List[str], concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    from app.main import app
+
+    semaphore = asyncio.Semaphore(concurrency)
+    ask_latencies: List[float] = []
+    reload_latencies: List[float] = []
+    first_token: List[float] = []
+    errors = 0
+
+    # ASGITransport does not run lifespan events, so enter the app's lifespan by hand
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+        # The index loads in the background after startup
+        while True:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                startup = response.json()["startup"]
+                break
+            if "loading" not in response.json().get("detail", ""):
+                raise RuntimeError(response.json()["detail"])
+            await asyncio.sleep(0.01)
+
+        async def ask(question: str, latencies: List[float] = ask_latencies) -> None:
+            nonlocal errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                response = await client.post("/ask", json={"question": question, "use_cache": False})
+                latencies.append(time.perf_counter() - t0)
+                errors += response.status_code != 200
+
+        async def stream(question: str) -> None:
+            async with semaphore:
+                t0 = time.perf_counter()
+                async with client.stream(
+                    "POST", "/ask/stream", json={"question": question, "use_cache": False}
+                ) as response:
+                    seen_token = False
+                    async for line in response.aiter_lines():
+                        if not seen_token and line.startswith("event: token"):
+                            first_token.append(time.perf_counter() - t0)
+                            seen_token = True
+
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(q) for q in questions))
+        ask_seconds = time.perf_counter() - started
+        await asyncio.gather(*(stream(q) for q in questions))
+
+        # Reload the same index while a wave of requests is in flight; their latencies
+        # are reported apart from the steady-state ones above
+        t0 = time.perf_counter()
+        reload_task = asyncio.ensure_future(
+            client.post(
+                "/admin/reload",
+                params={"force": "true"},
+                headers={"X-Admin-Token": os.environ["ADMIN_TOKEN"]},
+            )
+        )
+        await asyncio.gather(*(ask(q, reload_latencies) for q in questions[:concurrency]))
+        reload = (await reload_task).json()
+        reload["seconds"] = time.perf_counter() - t0
+
+    return {
+        "startup": startup,
+        "reload": {
+            **{key: reload[key] for key in ("load_seconds", "swap_seconds", "seconds")},
+            "ask_during_reload": _latency_summary(reload_latencies),
+        },
+        "concurrency": concurrency,
+        "errors": errors,
+        "ask": {**_latency_summary(ask_latencies), "requests_per_sec": len(questions) / ask_seconds},
+        "stream_time_to_first_token": _latency_summary(first_token),
+    }
+
+
+def bench_api(questions: List[str], concurrency: int) -> Dict[str, Any]:
+    return asyncio.run(_bench_api(questions, concurrency))
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    current, before = _flatten(results), _flatten(baseline)
+    print(f"{'metric':<48}{'baseline':>14}{'current':>14}{'change':>10}", file=sys.stderr)
+    for name in sorted(current.keys() & before.keys()):
+        if name.startswith("meta.") or name.startswith("params."):
+            continue
+        old, new = before[name], current[name]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{name:<48}{old:>14.3f}{new:>14.3f}{change:>10}", file=sys.stderr)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Offline ingestion and query benchmarks with fake embedding and chat models"
+    )
+    parser.add_argument("--books", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=30, help="Pages per book")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument(
+        "--chunk-pages", type=int, default=2000, help="Pages per language for the chunking benchmark"
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /ask requests")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.05, help="Seconds the fake LLM takes per call"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="Write results here (JSON); default stdout")
+    parser.add_argument("--baseline", type=Path, help="Earlier results to compare against")
+    parser.add_argument("--keep", type=Path, help="Use this DATA_DIR and keep it afterwards")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        data_dir = args.keep or Path(tmp)
+        os.environ.update(OFFLINE_ENV)
+        os.environ["DATA_DIR"] = str(data_dir)
+        os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+        # The reload step calls /admin/reload, which needs a token
+        os.environ["ADMIN_TOKEN"] = secrets.token_hex(16)
+
+        from rag.config import load_settings
+
+        settings = load_settings()
+        pdf_paths = generate_corpus(settings.pdf_dir, args.books, args.pages, args.seed)
+        questions = generate_questions(args.questions, args.seed + 1)
+
+        results: Dict[str, Any] = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+            },
+            "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        }
+        print("chunking ...", file=sys.stderr)
+        results["chunking"] = bench_chunking(settings, args.chunk_pages, args.seed)
+        print("ingest ...", file=sys.stderr)
+        results["ingest"] = bench_ingest(settings, pdf_paths)
+        print("ask_question ...", file=sys.stderr)
+        results["ask_question"] = bench_ask_question(settings, questions)
+        print("api ...", file=sys.stderr)
+        results["api"] = bench_api(questions, args.concurrency)
+
+    text = json.dumps(results, indent=2)
+    if args.out is not None:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.baseline is not None:
+        compare(results, json.loads(args.baseline.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
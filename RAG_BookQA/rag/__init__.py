@@ -1,11 +1,22 @@
 __all__ = [
     "config",
     "embeddings",
+    "embedding_cache",
     "llm",
     "loader",
     "vectorstore",
+    "quantization",
+    "chunkstore",
+    "manifest",
     "retriever",
+    "shards",
+    "sparse",
+    "cache",
+    "context",
     "chain",
+    "answer_cache",
+    "memory",
+    "metrics",
     "utils",
 ]
 
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Dict[str, Any]]
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    row: int
+    language: str
+    index_version: str
+    answer: str
+    sources: List[Dict[str, Any]]
+
+
+# Rows allocated on the first store; the matrix doubles from here up to max_entries
+_INITIAL_ROWS = 64
+
+
+class SemanticAnswerCache:
+    # Answers keyed by question embedding: a lookup hits when a cached question with
+    # the same language and index version is within the cosine similarity threshold.
+    def __init__(self, max_entries: int, ttl_seconds: float, threshold: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        # Least recently used first
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Oldest first, for the TTL
+        self._created: "OrderedDict[int, float]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # Unit vectors of all entries, one row each, written in place by store().
+        # Rows of evicted and expired entries are freed and reused; _row_keys holds the
+        # entry key of each row (-1 when free) and only rows below _high are searched.
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._row_keys = np.zeros(0, dtype=np.int64)
+        self._free: List[int] = []
+        self._high = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _remove(self, key: int) -> None:
+        row = self._entries.pop(key).row
+        del self._created[key]
+        self._row_keys[row] = -1
+        self._free.append(row)
+
+    def _expire(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._created:
+            key, created = next(iter(self._created.items()))
+            if created >= cutoff:
+                break
+            self._remove(key)
+
+    def _reset(self, dimension: int) -> None:
+        # Also used when the embedding size changes: older vectors cannot be compared
+        self._entries.clear()
+        self._created.clear()
+        self._matrix = np.zeros((min(_INITIAL_ROWS, self.max_entries), dimension), dtype=np.float32)
+        self._row_keys = np.full(len(self._matrix), -1, dtype=np.int64)
+        self._free = []
+        self._high = 0
+
+    def _allocate_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._high == len(self._matrix):
+            rows = min(2 * len(self._matrix), self.max_entries)
+            matrix = np.zeros((rows, self._matrix.shape[1]), dtype=np.float32)
+            matrix[: self._high] = self._matrix
+            row_keys = np.full(rows, -1, dtype=np.int64)
+            row_keys[: self._high] = self._row_keys
+            self._matrix, self._row_keys = matrix, row_keys
+        self._high += 1
+        return self._high - 1
+
+    def lookup(
+        self, embedding: Sequence[float], language: str, index_version: str
+    ) -> Optional[CachedAnswer]:
+        if not self.enabled:
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            self._expire()
+            best: Optional[CachedAnswer] = None
+            if self._high and self._matrix.shape[1] == query.shape[0]:
+                similarities = self._matrix[: self._high] @ query
+                rows = np.flatnonzero(
+                    (similarities >= self.threshold) & (self._row_keys[: self._high] >= 0)
+                )
+                for row in rows[np.argsort(-similarities[rows], kind="stable")]:
+                    key = int(self._row_keys[row])
+                    entry = self._entries[key]
+                    if entry.language == language and entry.index_version == index_version:
+                        self._entries.move_to_end(key)
+                        best = CachedAnswer(entry.answer, entry.sources, float(similarities[row]))
+                        break
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        language: str,
+        index_version: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+    ) -> None:
+        if not self.enabled:
+            return
+        vector = self._unit(embedding)
+        with self._lock:
+            if self._matrix.shape[1] != vector.shape[0]:
+                self._reset(vector.shape[0])
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            row = self._allocate_row()
+            self._matrix[row] = vector
+            key = self._next_key
+            self._next_key += 1
+            self._row_keys[row] = key
+            self._entries[key] = _Entry(row, language, index_version, answer, sources)
+            self._created[key] = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._created.clear()
+            self._row_keys.fill(-1)
+            self._free = []
+            self._high = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+        }
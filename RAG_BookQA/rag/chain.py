@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
 
 from .config import RAGSettings
 from .llm import create_llm
-from .retriever import create_retriever
+from .retriever import CachedRetriever, create_retriever
+from .shards import ShardedRetriever, select_shards
+from .embedding_cache import normalize_text
+from .sparse import tokenize
 
 
 SYSTEM_PROMPT = (
@@ -18,17 +23,47 @@ SYSTEM_PROMPT = (
     "Use only the provided context. If the answer is not in the context, say you do not know."
 )
 
+# Only the answer LLM carries this tag, so streaming skips the question-condensing call.
+# The tags also name the stages these calls are timed under (see rag.metrics).
+ANSWER_TAG = "rag_answer"
+CONDENSE_TAG = "rag_condense"
+SUMMARY_TAG = "rag_summary"
 
-def build_conversational_chain(settings: RAGSettings, vector_store: FAISS) -> ConversationalRetrievalChain:
-    llm = create_llm(settings)
-    retriever = create_retriever(settings, vector_store)
+# How a question reached retrieval: no history to condense, judged self-contained
+# (history skipped), or rewritten by the condense-question LLM call
+PATH_NO_HISTORY = "no_history"
+PATH_STANDALONE = "standalone"
+PATH_CONDENSED = "condensed"
 
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True,
-        output_key="answer",
-    )
+# Words that point back into the conversation, English and Bangla
+_ANAPHORA = frozenset(
+    """
+    he him his she her hers it its they them their theirs this that these those
+    there then former latter above previous earlier same such another other else
+    one ones more also again too further why
+    সে তিনি তাঁর তার তাকে তাঁকে তারা তাঁরা তাদের তাঁদের উনি ওনার উনার ওরা ওদের
+    এটা এটি এটার এটির ওটা ওটি সেটা সেটি সেটার সেটির এই ওই ঐ সেই এর ওর এদের
+    এগুলো ওগুলো সেগুলো সেখানে এখানে তখন আগের পরের আরও আরো আবার কেন
+    """.split()
+)
+# Openers of elliptical follow-ups ("and the ending?", "what about ...")
+_CONTINUATIONS = frozenset("and but so or আর কিন্তু তাহলে তবে".split())
+# Anything shorter is rarely a complete question on its own
+MIN_STANDALONE_TOKENS = 4
+
+
+def build_conversational_chain(
+    settings: RAGSettings,
+    vector_store: Optional[FAISS] = None,
+    retriever: Optional[CachedRetriever] = None,
+) -> ConversationalRetrievalChain:
+    # Either a single index or a ready retriever (e.g. rag.shards.load_retriever)
+    llm = create_llm(settings, tags=[ANSWER_TAG])
+    if retriever is None:
+        retriever = create_retriever(settings, vector_store)
 
+    # No memory on the chain: callers pass each conversation's (trimmed) chat_history,
+    # so one chain serves any number of sessions. See rag.memory.
     # Chat prompt for combine docs phase: expects 'context' and 'question'
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -39,8 +74,8 @@ def build_conversational_chain(settings: RAGSettings, vector_store: FAISS) -> Co
 
     chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
+        condense_question_llm=create_llm(settings, tags=[CONDENSE_TAG]),
         retriever=retriever,
-        memory=memory,
         verbose=False,
         chain_type="stuff",
         return_source_documents=True,
@@ -50,19 +85,147 @@ def build_conversational_chain(settings: RAGSettings, vector_store: FAISS) -> Co
     return chain
 
 
-def ask_question(chain: ConversationalRetrievalChain, question: str) -> Tuple[str, List[Dict]]:
-    result = chain.invoke({"question": question})
-    answer: str = result.get("answer", "")
+def scoped_chain(
+    chain: ConversationalRetrievalChain, book: Optional[str] = None, collection: Optional[str] = None
+) -> ConversationalRetrievalChain:
+    # A shallow copy of the chain that searches only the shards of one book or collection
+    if not book and not collection:
+        return chain
+    retriever = chain.retriever
+    if not isinstance(retriever, ShardedRetriever):
+        raise ValueError("Book and collection filters need a sharded index (SHARD_BY=book|collection)")
+    names = select_shards(retriever.manager.catalog, book, collection)
+    if not names:
+        raise LookupError(f"No indexed book matches book={book!r}, collection={collection!r}")
+    return chain.model_copy(update={"retriever": retriever.scoped(names)})
+
+
+def normalize_language(language: Optional[str]) -> str:
+    lang = (language or "auto").lower()
+    return "bn" if lang in {"bn", "bangla", "bengali"} else lang
+
+
+def localize_question(question: str, lang: str) -> str:
+    if lang == "en":
+        return "Please answer in English.\n" + question
+    if lang == "bn":
+        return "অনুগ্রহ করে বাংলায় উত্তর দিন।\n" + question
+    return question
+
+
+def is_standalone(question: str) -> bool:
+    tokens = tokenize(question)
+    if len(tokens) < MIN_STANDALONE_TOKENS:
+        return False
+    if tokens[0] in _CONTINUATIONS or tokens[1] == "about":
+        return False
+    return not any(token in _ANAPHORA for token in tokens)
+
+
+def select_history(
+    question: str, chat_history: Optional[List[BaseMessage]], mode: str = "auto"
+) -> Tuple[List[BaseMessage], str]:
+    # Returns the history to hand to the chain and the path taken. An empty history
+    # makes ConversationalRetrievalChain retrieve on the raw question, skipping the
+    # condense-question LLM call. mode="always" keeps the history for every follow-up.
+    if not chat_history:
+        return [], PATH_NO_HISTORY
+    if mode != "always" and is_standalone(question):
+        return [], PATH_STANDALONE
+    return chat_history, PATH_CONDENSED
+
+
+def _format_sources(documents: List[Document]) -> List[Dict]:
     sources = []
-    for doc in result.get("source_documents", []) or []:
+    for doc in documents or []:
         metadata = doc.metadata or {}
         sources.append(
             {
                 "source": metadata.get("source"),
                 "page": metadata.get("page"),
                 "score": metadata.get("score"),
+                "score_kind": metadata.get("score_kind"),
             }
         )
-    return answer, sources
+    return sources
+
+
+def _inputs(question: str, chat_history: Optional[List[BaseMessage]]) -> Dict[str, Any]:
+    return {"question": question, "chat_history": chat_history or []}
+
+
+def ask_question(
+    chain: ConversationalRetrievalChain,
+    question: str,
+    chat_history: Optional[List[BaseMessage]] = None,
+) -> Tuple[str, List[Dict]]:
+    result = chain.invoke(_inputs(question, chat_history))
+    return result.get("answer", ""), _format_sources(result.get("source_documents", []))
+
+
+async def aask_question(
+    chain: ConversationalRetrievalChain,
+    question: str,
+    chat_history: Optional[List[BaseMessage]] = None,
+) -> Tuple[str, List[Dict]]:
+    result = await chain.ainvoke(_inputs(question, chat_history))
+    return result.get("answer", ""), _format_sources(result.get("source_documents", []))
+
+
+async def astream_answer(
+    chain: ConversationalRetrievalChain,
+    question: str,
+    chat_history: Optional[List[BaseMessage]] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    # Yields ("token", text) as the answer LLM generates, then one ("sources", [...])
+    # once the chain has finished.
+    async for event in chain.astream_events(_inputs(question, chat_history), version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream" and ANSWER_TAG in event.get("tags", []):
+            text = event["data"]["chunk"].text()
+            if text:
+                yield "token", text
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            output = event["data"].get("output") or {}
+            yield "sources", _format_sources(output.get("source_documents", []))
+
+
+async def aanswer_batch(
+    chain: ConversationalRetrievalChain,
+    questions: Sequence[Tuple[str, str]],
+    max_concurrency: int,
+) -> AsyncIterator[Tuple[int, str, List[Dict], Optional[str], List[float]]]:
+    # Answers standalone (question, language) pairs, yielding
+    # (index, answer, sources, error, query embedding) in completion order. Retrieval
+    # for the whole batch is one batched embedding call plus one matrix search;
+    # identical questions are answered once and reported for every index that asked them.
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for i, (question, lang) in enumerate(questions):
+        groups.setdefault((normalize_text(question).casefold(), lang), []).append(i)
+    firsts = [indexes[0] for indexes in groups.values()]
+
+    loop = asyncio.get_running_loop()
+    retrieved, embeddings = await loop.run_in_executor(
+        None, chain.retriever.batch_retrieve, [questions[i][0] for i in firsts]
+    )
+
+    combine = chain.combine_docs_chain
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
 
+    async def answer(group: int) -> Tuple[int, str, List[Dict], Optional[str]]:
+        question, lang = questions[firsts[group]]
+        docs = retrieved[group]
+        async with semaphore:
+            try:
+                result = await combine.ainvoke(
+                    {"input_documents": docs, "question": localize_question(question, lang)}
+                )
+                return group, result[combine.output_key], _format_sources(docs), None
+            except Exception as e:  # noqa: BLE001
+                return group, "", _format_sources(docs), str(e)
 
+    members = list(groups.values())
+    for next_done in asyncio.as_completed([answer(g) for g in range(len(firsts))]):
+        group, text, sources, error = await next_done
+        for i in members[group]:
+            yield i, text, sources, error, embeddings[group]
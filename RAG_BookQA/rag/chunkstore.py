@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from .utils import load_npy, replace_dir
+
+
+# Columnar, memory-mapped replacement for the pickled FAISS docstore. Row i holds the
+# chunk stored at FAISS position i; only rows that are actually read get paged in.
+#
+#   text.bin        UTF-8 chunk texts, back to back
+#   offsets.npy     int64[n + 1] byte offsets into text.bin
+#   ids.npy         bytes[n] docstore ids
+#   id_order.npy    int64[n] argsort of ids, for binary-search lookups by id
+#   source_idx.npy  int32[n] index into sources.json (-1 when unknown)
+#   pages.npy       int32[n] page number (-1 when unknown)
+#   sources.json    distinct source paths
+CHUNKS_DIRNAME = "chunks"
+NO_VALUE = -1
+
+
+def chunks_dir(directory: Path) -> Path:
+    return directory / CHUNKS_DIRNAME
+
+
+def chunk_store_exists(directory: Path) -> bool:
+    return (chunks_dir(directory) / "offsets.npy").exists()
+
+
+def write_chunk_store(directory: Path, ids: Sequence[str], documents: Sequence[Document]) -> None:
+    target = chunks_dir(directory)
+    tmp = directory / (CHUNKS_DIRNAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    sources: Dict[str, int] = {}
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    source_idx = np.full(len(documents), NO_VALUE, dtype=np.int32)
+    pages = np.full(len(documents), NO_VALUE, dtype=np.int32)
+    with (tmp / "text.bin").open("wb") as f:
+        for row, doc in enumerate(documents):
+            data = doc.page_content.encode("utf-8")
+            f.write(data)
+            offsets[row + 1] = offsets[row] + len(data)
+            source = doc.metadata.get("source")
+            if source is not None:
+                source_idx[row] = sources.setdefault(str(source), len(sources))
+            page = doc.metadata.get("page")
+            if page is not None:
+                pages[row] = int(page)
+
+    encoded_ids = np.array([id_.encode("utf-8") for id_ in ids], dtype=np.bytes_)
+    if not len(encoded_ids):
+        encoded_ids = np.zeros(0, dtype="S1")
+    np.save(tmp / "offsets.npy", offsets)
+    np.save(tmp / "ids.npy", encoded_ids)
+    np.save(tmp / "id_order.npy", np.argsort(encoded_ids, kind="stable").astype(np.int64))
+    np.save(tmp / "source_idx.npy", source_idx)
+    np.save(tmp / "pages.npy", pages)
+    (tmp / "sources.json").write_text(json.dumps(list(sources), ensure_ascii=False), encoding="utf-8")
+
+    replace_dir(tmp, target)
+
+
+class MmapDocstore(Docstore):
+    def __init__(self, directory: Path) -> None:
+        path = chunks_dir(directory)
+        self.offsets = load_npy(path / "offsets.npy", mmap_mode="r")
+        self.ids = load_npy(path / "ids.npy", mmap_mode="r")
+        self.id_order = load_npy(path / "id_order.npy", mmap_mode="r")
+        self.source_idx = load_npy(path / "source_idx.npy", mmap_mode="r")
+        self.pages = load_npy(path / "pages.npy", mmap_mode="r")
+        self.sources: List[str] = json.loads((path / "sources.json").read_text(encoding="utf-8"))
+        text_path = path / "text.bin"
+        # np.memmap refuses empty files, which an index with no chunks legitimately has
+        self.text = (
+            np.memmap(text_path, dtype=np.uint8, mode="r")
+            if text_path.stat().st_size
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def id_at(self, row: int) -> str:
+        return bytes(self.ids[row]).decode("utf-8")
+
+    def row_of(self, id_: str) -> Optional[int]:
+        # Binary search over the id_order permutation: O(log n) page touches, no id dict
+        key = id_.encode("utf-8")
+        lo, hi = 0, len(self.id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self.ids[self.id_order[mid]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.id_order) and bytes(self.ids[self.id_order[lo]]) == key:
+            return int(self.id_order[lo])
+        return None
+
+    def document_at(self, row: int) -> Document:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        metadata: Dict[str, Union[str, int]] = {}
+        source = int(self.source_idx[row])
+        if source != NO_VALUE:
+            metadata["source"] = self.sources[source]
+        page = int(self.pages[row])
+        if page != NO_VALUE:
+            metadata["page"] = page
+        return Document(
+            id=self.id_at(row),
+            page_content=self.text[start:end].tobytes().decode("utf-8"),
+            metadata=metadata,
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self.row_of(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document_at(row)
+
+    def to_in_memory(self) -> InMemoryDocstore:
+        return InMemoryDocstore({self.id_at(row): self.document_at(row) for row in range(len(self))})
+
+
+class PositionIds(Mapping[int, str]):
+    # Read-only FAISS position -> docstore id view, decoded on access
+    def __init__(self, docstore: MmapDocstore) -> None:
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self.docstore):
+            raise KeyError(position)
+        return self.docstore.id_at(int(position))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.docstore)))
+
+    def __len__(self) -> int:
+        return len(self.docstore)
@@ -18,15 +18,59 @@ class RAGSettings:
     embedding_model_name: str
     chunk_size: int
     chunk_overlap: int
+    chunker: str
+    chunk_tokens: int
+    chunk_overlap_tokens: int
     retrieval_k: int
     model_temperature: float
+    load_workers: int
+    embedding_provider: str
+    embed_batch_size: int
+    embed_concurrency: int
+    embed_max_retries: int
+    checkpoint_every: int
+    embedding_cache_path: Path
+    embedding_cache_max_entries: int
+    retriever_cache_size: int
+    retriever_cache_ttl: float
+    index_type: str
+    ivf_nlist: int
+    ivf_nprobe: int
+    pq_m: int
+    pq_nbits: int
+    hnsw_m: int
+    hnsw_ef_search: int
+    vector_quantization: str
+    rerank_factor: int
+    retrieval_mode: str
+    hybrid_candidates: int
+    rrf_k: int
+    answer_cache_size: int
+    answer_cache_ttl: float
+    answer_cache_threshold: float
+    session_max_entries: int
+    session_idle_ttl: float
+    history_token_budget: int
+    history_summary: bool
+    condense_mode: str
+    batch_concurrency: int
+    context_token_budget: int
+    context_mmr: bool
+    context_mmr_lambda: float
+    llm_provider: str
+    fake_llm_latency: float
+    metrics_enabled: bool
+    shard_by: str
+    shard_max_loaded: int
+    index_watch_interval: float
+    admin_token: str
 
 
 def load_settings() -> RAGSettings:
     load_dotenv()  # Load .env if present
 
     project_root = Path(__file__).resolve().parents[1]
-    data_dir = project_root / "data"
+    data_dir = Path(os.getenv("DATA_DIR", str(project_root / "data")))
     pdf_dir = data_dir / "pdfs"
     vectorstore_dir = data_dir / "vectorstore"
 
@@ -35,8 +79,54 @@ def load_settings() -> RAGSettings:
     embedding_model_name = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-004")
     chunk_size = int(os.getenv("CHUNK_SIZE", "1000"))
     chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "200"))
+    chunker = os.getenv("CHUNKER", "recursive").lower()
+    chunk_tokens = int(os.getenv("CHUNK_TOKENS", "256"))
+    chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
     retrieval_k = int(os.getenv("RETRIEVAL_K", "5"))
     model_temperature = float(os.getenv("MODEL_TEMPERATURE", "0.2"))
+    load_workers = int(os.getenv("LOAD_WORKERS", str(os.cpu_count() or 1)))
+    embedding_provider = os.getenv("EMBEDDING_PROVIDER", "google").lower()
+    embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    embed_concurrency = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    embed_max_retries = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+    checkpoint_every = int(os.getenv("CHECKPOINT_EVERY", "20"))
+    embedding_cache_path = Path(
+        os.getenv("EMBEDDING_CACHE_PATH", str(data_dir / "embedding_cache.sqlite3"))
+    )
+    embedding_cache_max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+    retriever_cache_size = int(os.getenv("RETRIEVER_CACHE_SIZE", "2048"))
+    retriever_cache_ttl = float(os.getenv("RETRIEVER_CACHE_TTL", "3600"))
+    index_type = os.getenv("INDEX_TYPE", "flat").lower()
+    ivf_nlist = int(os.getenv("IVF_NLIST", "1024"))
+    ivf_nprobe = int(os.getenv("IVF_NPROBE", "16"))
+    pq_m = int(os.getenv("PQ_M", "64"))
+    pq_nbits = int(os.getenv("PQ_NBITS", "8"))
+    hnsw_m = int(os.getenv("HNSW_M", "32"))
+    hnsw_ef_search = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    vector_quantization = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+    rerank_factor = int(os.getenv("RERANK_FACTOR", "4"))
+    retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+    hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    rrf_k = int(os.getenv("RRF_K", "60"))
+    answer_cache_size = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+    answer_cache_ttl = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    answer_cache_threshold = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    session_max_entries = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+    session_idle_ttl = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+    history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "1000"))
+    history_summary = os.getenv("HISTORY_SUMMARY", "false").lower() in {"1", "true", "yes"}
+    condense_mode = os.getenv("CONDENSE_MODE", "auto").lower()
+    batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    context_mmr = os.getenv("CONTEXT_MMR", "false").lower() in {"1", "true", "yes"}
+    context_mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.5"))
+    llm_provider = os.getenv("LLM_PROVIDER", "google").lower()
+    fake_llm_latency = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+    metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() in {"1", "true", "yes"}
+    shard_by = os.getenv("SHARD_BY", "none").lower()
+    shard_max_loaded = int(os.getenv("SHARD_MAX_LOADED", "32"))
+    index_watch_interval = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+    admin_token = os.getenv("ADMIN_TOKEN", "")
 
     # Ensure dirs exist
     data_dir.mkdir(parents=True, exist_ok=True)
@@ -53,8 +143,52 @@ def load_settings() -> RAGSettings:
         embedding_model_name=embedding_model_name,
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
+        chunker=chunker,
+        chunk_tokens=chunk_tokens,
+        chunk_overlap_tokens=chunk_overlap_tokens,
         retrieval_k=retrieval_k,
         model_temperature=model_temperature,
+        load_workers=load_workers,
+        embedding_provider=embedding_provider,
+        embed_batch_size=embed_batch_size,
+        embed_concurrency=embed_concurrency,
+        embed_max_retries=embed_max_retries,
+        checkpoint_every=checkpoint_every,
+        embedding_cache_path=embedding_cache_path,
+        embedding_cache_max_entries=embedding_cache_max_entries,
+        retriever_cache_size=retriever_cache_size,
+        retriever_cache_ttl=retriever_cache_ttl,
+        index_type=index_type,
+        ivf_nlist=ivf_nlist,
+        ivf_nprobe=ivf_nprobe,
+        pq_m=pq_m,
+        pq_nbits=pq_nbits,
+        hnsw_m=hnsw_m,
+        hnsw_ef_search=hnsw_ef_search,
+        vector_quantization=vector_quantization,
+        rerank_factor=rerank_factor,
+        retrieval_mode=retrieval_mode,
+        hybrid_candidates=hybrid_candidates,
+        rrf_k=rrf_k,
+        answer_cache_size=answer_cache_size,
+        answer_cache_ttl=answer_cache_ttl,
+        answer_cache_threshold=answer_cache_threshold,
+        session_max_entries=session_max_entries,
+        session_idle_ttl=session_idle_ttl,
+        history_token_budget=history_token_budget,
+        history_summary=history_summary,
+        condense_mode=condense_mode,
+        batch_concurrency=batch_concurrency,
+        context_token_budget=context_token_budget,
+        context_mmr=context_mmr,
+        context_mmr_lambda=context_mmr_lambda,
+        llm_provider=llm_provider,
+        fake_llm_latency=fake_llm_latency,
+        metrics_enabled=metrics_enabled,
+        shard_by=shard_by,
+        shard_max_loaded=shard_max_loaded,
+        index_watch_interval=index_watch_interval,
+        admin_token=admin_token,
     )
 
 
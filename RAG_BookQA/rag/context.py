@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .config import RAGSettings
+from .embedding_cache import normalize_text
+from .manifest import parse_chunk_id
+from .memory import estimate_tokens
+
+
+# Shorter suffix/prefix matches between neighbours are more likely coincidence than overlap
+MIN_OVERLAP_CHARS = 20
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    # Longest suffix of `left` that is also a prefix of `right`, at most max_overlap chars
+    limit = min(len(left), len(right), max_overlap)
+    if limit < MIN_OVERLAP_CHARS:
+        return 0
+    tail = left[-limit:]
+    probe = right[:MIN_OVERLAP_CHARS]
+    start = tail.find(probe)
+    while start != -1:
+        if right.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def _clip(doc: Document, max_tokens: int) -> Document:
+    data = doc.page_content.encode("utf-8")[: max_tokens * 4]
+    return Document(
+        id=doc.id, page_content=data.decode("utf-8", errors="ignore"), metadata=dict(doc.metadata)
+    )
+
+
+class ContextPacker:
+    # Turns ranked chunks into the context for the "stuff" prompt: exact duplicates are
+    # dropped, consecutive chunks of the same file are merged with their overlap cut
+    # out, and chunks are taken in rank (or MMR) order while they fit the token budget.
+    def __init__(
+        self,
+        token_budget: int,
+        max_overlap: int,
+        embeddings: Optional[Embeddings] = None,
+        mmr_lambda: float = 0.5,
+    ) -> None:
+        self.token_budget = token_budget
+        self.max_overlap = max_overlap
+        # MMR needs chunk embeddings; None disables it
+        self.embeddings = embeddings
+        self.mmr_lambda = mmr_lambda
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "chunks_in": 0, "chunks_out": 0, "tokens_in": 0, "tokens_out": 0}
+
+    def _mmr_order(self, docs: List[Document], query_embedding: Sequence[float]) -> List[Document]:
+        doc_embeddings = self.embeddings.embed_documents([doc.page_content for doc in docs])
+        order = maximal_marginal_relevance(
+            np.asarray(query_embedding, dtype=np.float32),
+            doc_embeddings,
+            lambda_mult=self.mmr_lambda,
+            k=len(docs),
+        )
+        return [docs[i] for i in order]
+
+    def merge(self, docs: Sequence[Document]) -> List[Document]:
+        # Groups runs of consecutive chunk ids; groups keep the rank of their best chunk
+        runs: Dict[str, List[Tuple[int, int, Document]]] = {}
+        singles: List[Tuple[int, Document]] = []
+        for rank, doc in enumerate(docs):
+            parsed = parse_chunk_id(doc.id) if doc.id else None
+            if parsed is None:
+                singles.append((rank, doc))
+            else:
+                runs.setdefault(parsed[0], []).append((parsed[1], rank, doc))
+
+        merged: List[Tuple[int, Document]] = list(singles)
+        for chunks in runs.values():
+            chunks.sort(key=lambda chunk: chunk[0])
+            group = [chunks[0]]
+            for chunk in chunks[1:]:
+                if chunk[0] == group[-1][0] + 1:
+                    group.append(chunk)
+                else:
+                    merged.append(self._merge_group(group))
+                    group = [chunk]
+            merged.append(self._merge_group(group))
+        merged.sort(key=lambda item: item[0])
+        return [doc for _, doc in merged]
+
+    def _merge_group(self, group: List[Tuple[int, int, Document]]) -> Tuple[int, Document]:
+        best_rank, best = min(((rank, doc) for _, rank, doc in group), key=lambda item: item[0])
+        if len(group) == 1:
+            return best_rank, best
+        text = group[0][2].page_content
+        for _, _, doc in group[1:]:
+            cut = overlap_length(text, doc.page_content, self.max_overlap)
+            text += doc.page_content[cut:] if cut else "\n" + doc.page_content
+        first, last = group[0][2].metadata, group[-1][2].metadata
+        metadata: Dict[str, Any] = dict(best.metadata)
+        if "page" in first:
+            metadata["page"] = first["page"]
+        if "page" in last and last.get("page") != first.get("page"):
+            metadata["page_end"] = last["page"]
+        return best_rank, Document(id=group[0][2].id, page_content=text, metadata=metadata)
+
+    def _tokens(self, docs: Sequence[Document]) -> int:
+        return sum(estimate_tokens(doc.page_content) for doc in docs)
+
+    def pack(
+        self, docs: List[Document], query_embedding: Optional[Sequence[float]] = None
+    ) -> List[Document]:
+        if self.embeddings is not None and query_embedding is not None and len(docs) > 1:
+            docs = self._mmr_order(docs, query_embedding)
+
+        seen = set()
+        selected: List[Document] = []
+        packed: List[Document] = []
+        for doc in docs:
+            key = normalize_text(doc.page_content)
+            if key in seen:
+                continue
+            seen.add(key)
+            # A neighbour already in the context makes this chunk cost only its new text
+            trial = self.merge(selected + [doc])
+            if self._tokens(trial) <= self.token_budget:
+                selected.append(doc)
+                packed = trial
+            elif not selected:
+                selected.append(_clip(doc, self.token_budget))
+                packed = self.merge(selected)
+
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["chunks_in"] += len(docs)
+            self._totals["chunks_out"] += len(packed)
+            self._totals["tokens_in"] += self._tokens(docs)
+            self._totals["tokens_out"] += self._tokens(packed)
+        return packed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._totals)
+        stats["token_budget"] = self.token_budget
+        stats["mmr"] = self.embeddings is not None
+        stats["token_ratio"] = stats["tokens_out"] / stats["tokens_in"] if stats["tokens_in"] else 1.0
+        return stats
+
+
+def create_context_packer(settings: RAGSettings, embeddings: Embeddings) -> Optional[ContextPacker]:
+    if settings.context_token_budget <= 0:
+        return None
+    return ContextPacker(
+        settings.context_token_budget,
+        # Sentence-chunker overlap is counted in tokens of ~4 bytes
+        max(settings.chunk_overlap, settings.chunk_overlap_tokens * 4),
+        embeddings=embeddings if settings.context_mmr else None,
+        mmr_lambda=settings.context_mmr_lambda,
+    )
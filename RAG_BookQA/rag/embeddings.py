@@ -1,17 +1,45 @@
 from __future__ import annotations
 
+from typing import List
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.embeddings import Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 from .config import RAGSettings
+from .embedding_cache import CachedEmbeddings
+
+
+FAKE_EMBEDDING_SIZE = 768
+
 
+class _GoogleEmbeddings(GoogleGenerativeAIEmbeddings):
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Batched requests with the same task type embed_query uses
+        return self.embed_documents(texts, task_type=self.task_type or "RETRIEVAL_QUERY")
+
+
+def _create_base_embeddings(settings: RAGSettings) -> Embeddings:
+    if settings.embedding_provider == "fake":
+        # Local, deterministic backend for offline ingestion runs and benchmarks
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
 
-def create_embeddings(settings: RAGSettings) -> GoogleGenerativeAIEmbeddings:
     if not settings.google_api_key:
         raise RuntimeError("GOOGLE_API_KEY is not set. Please configure it in your environment.")
 
-    return GoogleGenerativeAIEmbeddings(
+    return _GoogleEmbeddings(
         model=settings.embedding_model_name,
         google_api_key=settings.google_api_key,
     )
 
 
+def create_embeddings(settings: RAGSettings) -> Embeddings:
+    embeddings = _create_base_embeddings(settings)
+    if settings.embedding_cache_max_entries <= 0:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        settings.embedding_cache_path,
+        namespace=f"{settings.embedding_provider}:{settings.embedding_model_name}",
+        max_entries=settings.embedding_cache_max_entries,
+    )
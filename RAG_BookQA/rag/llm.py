@@ -1,11 +1,88 @@
 from __future__ import annotations
 
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from . import metrics
 from .config import RAGSettings
+from .memory import estimate_tokens
+
+
+class _FakeChatModel(BaseChatModel):
+    # Offline stand-in for Gemini: a deterministic answer after `latency` seconds,
+    # streamed word by word. Used for benchmarks and for running without an API key.
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-rag"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt_chars = sum(len(str(message.content)) for message in messages)
+        return f"This is a placeholder answer from the fake model ({prompt_chars} prompt characters)."
+
+    def _usage(self, messages: List[BaseMessage], answer: str) -> Dict[str, int]:
+        prompt = sum(estimate_tokens(str(message.content)) for message in messages)
+        completion = estimate_tokens(answer)
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        answer = self._answer(messages)
+        message = AIMessage(answer, usage_metadata=self._usage(messages, answer))
+        return ChatResult(generations=[ChatGeneration(message=message)])
 
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        answer = self._answer(messages)
+        for token in re.split(r"(\s)", answer):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, answer)))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        answer = self._answer(messages)
+        for token in re.split(r"(\s)", answer):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, answer)))
+
+
+def create_llm(settings: RAGSettings, tags: Optional[List[str]] = None) -> BaseChatModel:
+    # Tag with "rag_<stage>" (see rag.metrics) to time calls under that stage name.
+    # Only the API turns metrics on; the CLI, ingestion and benchmarks have no
+    # /metrics to read them, so their LLM calls skip the callback.
+    callbacks = [metrics.LLM_TIMER] if metrics.enabled() else None
+    if settings.llm_provider == "fake":
+        return _FakeChatModel(latency=settings.fake_llm_latency, tags=tags, callbacks=callbacks)
 
-def create_llm(settings: RAGSettings) -> ChatGoogleGenerativeAI:
     if not settings.google_api_key:
         raise RuntimeError("GOOGLE_API_KEY is not set. Please configure it in your environment.")
 
@@ -13,6 +90,6 @@ def create_llm(settings: RAGSettings) -> ChatGoogleGenerativeAI:
         model=settings.gemini_model_name,
         google_api_key=settings.google_api_key,
         temperature=settings.model_temperature,
+        tags=tags,
+        callbacks=callbacks,
     )
-
-
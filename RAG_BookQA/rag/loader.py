@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -10,24 +12,157 @@ from langchain_community.document_loaders import PyPDFLoader
 from .config import RAGSettings
 
 
-def _load_single_pdf(pdf_path: Path) -> List[Document]:
+CHUNKERS = ("sentence", "recursive")
+# The patterns run on UTF-8 bytes, so span lengths are byte counts and token
+# estimates (rag.memory.estimate_tokens: ~4 bytes per token) need no re-encoding.
+# A sentence ends at ., !, ?, the danda (।) or double danda (॥), plus any closing
+# quotes or brackets, followed by whitespace; a blank line ends one too. Every match
+# starts at a byte from a small set (the danda by its last byte, confirmed by a
+# lookbehind), which lets the regex engine skip ahead ~5x faster than alternation.
+_SENTENCE_END_RE = re.compile(
+    rb"[.!?\xa4\xa5\n](?:(?<=\n)[ \t]*\n\s*"
+    rb"|(?:(?<=[.!?])|(?<=\xe0\xa5[\xa4\xa5]))(?:[.!?]|\xe0\xa5[\xa4\xa5])*(?:[\"')\]]|\xe2\x80[\x99\x9d])*\s+)"
+)
+# Fallbacks for a "sentence" over the budget: line breaks (verse), then words
+_LINE_RE = re.compile(rb"[^\n]*\n+|[^\n]+$")
+_WORD_RE = re.compile(rb"\S+\s*")
+
+# (start, end, estimated tokens) of a piece of page text, in bytes
+Span = Tuple[int, int, int]
+
+
+def load_pdf(pdf_path: Path) -> List[Document]:
     loader = PyPDFLoader(str(pdf_path))
     return loader.load()
 
 
+def list_pdfs(settings: RAGSettings) -> List[Path]:
+    # Subfolders of data/pdfs are collections (see rag.shards)
+    return sorted(settings.pdf_dir.rglob("*.pdf"))
+
+
 def load_pdfs(settings: RAGSettings) -> List[Document]:
     documents: List[Document] = []
-    for pdf_file in sorted(settings.pdf_dir.glob("*.pdf")):
-        documents.extend(_load_single_pdf(pdf_file))
+    for pdf_file in list_pdfs(settings):
+        documents.extend(load_pdf(pdf_file))
     return documents
 
 
-def split_documents(settings: RAGSettings, documents: List[Document]) -> List[Document]:
-    splitter = RecursiveCharacterTextSplitter(
+def iter_pdf_pages(
+    pdf_paths: Iterable[Path], max_workers: int
+) -> Iterator[Tuple[Path, List[Document]]]:
+    # Parse in a process pool and yield each file's pages as it finishes. The unit
+    # of work is a whole file (PyPDFLoader parses one file at a time): at most
+    # 2 * max_workers parsed files are held at once, so peak memory is bounded by the
+    # text of the largest PDFs times the worker count, not by the size of the corpus
+    # and not by the embedding batch size.
+    paths = iter(pdf_paths)
+    if max_workers <= 1:
+        for pdf_path in paths:
+            yield pdf_path, load_pdf(pdf_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending: Dict[Future, Path] = {}
+
+        def _submit_next() -> None:
+            pdf_path = next(paths, None)
+            if pdf_path is not None:
+                pending[pool.submit(load_pdf, pdf_path)] = pdf_path
+
+        for _ in range(2 * max_workers):
+            _submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path = pending.pop(future)
+                _submit_next()
+                yield pdf_path, future.result()
+
+
+def _tokens(start: int, end: int) -> int:
+    return (end - start) // 4 + 1
+
+
+def _fit(data: bytes, start: int, end: int, max_tokens: int) -> List[Span]:
+    # Splits an over-long sentence at line breaks, and an over-long line at words
+    if _tokens(start, end) <= max_tokens:
+        return [(start, end, _tokens(start, end))] if end > start else []
+    lines = [m.span() for m in _LINE_RE.finditer(data, start, end)]
+    if len(lines) > 1:
+        return [span for s, e in lines for span in _fit(data, s, e, max_tokens)]
+    # A single word over the budget stays whole; the embedding model truncates it
+    words = [(s, e, _tokens(s, e)) for s, e in (m.span() for m in _WORD_RE.finditer(data, start, end))]
+    return words or [(start, end, _tokens(start, end))]
+
+
+def _split_sentences(data: bytes, max_tokens: int) -> List[Span]:
+    # One pass over the text; each sentence keeps its trailing whitespace
+    spans: List[Span] = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(data):
+        end = match.end()
+        if _tokens(start, end) <= max_tokens:
+            spans.append((start, end, _tokens(start, end)))
+        else:
+            spans.extend(_fit(data, start, end, max_tokens))
+        start = end
+    if start < len(data):
+        spans.extend(_fit(data, start, len(data), max_tokens))
+    return spans
+
+
+def chunk_text(text: str, chunk_tokens: int, overlap_tokens: int) -> List[str]:
+    # Packs whole sentences into chunks of at most chunk_tokens (estimated) tokens.
+    # Each chunk starts with the last sentences of the previous one, up to
+    # overlap_tokens, so the overlap is always exact text (see rag.context).
+    data = text.encode("utf-8")
+    spans = _split_sentences(data, chunk_tokens)
+    chunks: List[str] = []
+    i = 0
+    while i < len(spans):
+        j, total = i, 0
+        while j < len(spans) and (j == i or total + spans[j][2] <= chunk_tokens):
+            total += spans[j][2]
+            j += 1
+        # Spans end on ASCII bytes or whole characters, so the slice always decodes
+        chunk = data[spans[i][0] : spans[j - 1][1]].decode("utf-8").strip()
+        if chunk:
+            chunks.append(chunk)
+        if j == len(spans):
+            break
+        k, overlap = j, 0
+        while k - 1 > i and overlap + spans[k - 1][2] <= overlap_tokens:
+            k -= 1
+            overlap += spans[k][2]
+        i = k
+    return chunks
+
+
+def _iter_sentence_chunks(settings: RAGSettings, pages: Iterable[Document]) -> Iterator[Document]:
+    for page in pages:
+        for chunk in chunk_text(page.page_content, settings.chunk_tokens, settings.chunk_overlap_tokens):
+            yield Document(page_content=chunk, metadata=dict(page.metadata))
+
+
+def _create_splitter(settings: RAGSettings) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=settings.chunk_size,
         chunk_overlap=settings.chunk_overlap,
         separators=["\n\n", "\n", "।", ".", " ", ""],  # include Bangla danda
     )
-    return splitter.split_documents(documents)
 
 
+def iter_chunks(settings: RAGSettings, pages: Iterable[Document]) -> Iterator[Document]:
+    if settings.chunker == "sentence":
+        yield from _iter_sentence_chunks(settings, pages)
+        return
+    if settings.chunker != "recursive":
+        raise ValueError(f"Unknown CHUNKER {settings.chunker!r}; expected one of {', '.join(CHUNKERS)}")
+    splitter = _create_splitter(settings)
+    for page in pages:
+        yield from splitter.split_documents([page])
+
+
+def split_documents(settings: RAGSettings, documents: List[Document]) -> List[Document]:
+    return list(iter_chunks(settings, documents))
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import RAGSettings
+
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class FileRecord:
+    sha256: str
+    chunk_size: int
+    chunk_overlap: int
+    embedding_model: str
+    chunk_ids: List[str] = field(default_factory=list)
+    # Manifests written before the sentence chunker existed used the recursive one
+    chunker: str = "recursive"
+
+
+@dataclass
+class IngestPlan:
+    new: List[Path] = field(default_factory=list)
+    changed: List[Path] = field(default_factory=list)
+    unchanged: List[Path] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def to_embed(self) -> List[Path]:
+        return sorted(self.new + self.changed)
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_key(settings: RAGSettings, pdf_path: Path) -> str:
+    return pdf_path.relative_to(settings.pdf_dir).as_posix()
+
+
+def chunker_spec(settings: RAGSettings) -> str:
+    if settings.chunker == "sentence":
+        return f"sentence:{settings.chunk_tokens}:{settings.chunk_overlap_tokens}"
+    return settings.chunker
+
+
+def chunk_id_prefix(settings: RAGSettings, sha256: str) -> str:
+    # Chunk ids depend on the chunking settings too, so a resumed run never mistakes
+    # a chunk produced with different settings for one it has already embedded
+    fingerprint = f"{sha256}:{settings.chunk_size}:{settings.chunk_overlap}:{settings.embedding_model_name}"
+    spec = chunker_spec(settings)
+    if spec != "recursive":
+        # Recursive-chunker ids predate this and stay as they were
+        fingerprint += f":{spec}"
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(prefix: str, index: int) -> str:
+    return f"{prefix}-{index}"
+
+
+def parse_chunk_id(chunk_id: str) -> Optional[Tuple[str, int]]:
+    # (prefix, index) for ids made by make_chunk_id, None for anything else
+    prefix, sep, index = chunk_id.rpartition("-")
+    if not sep or not index.isdigit():
+        return None
+    return prefix, int(index)
+
+
+def load_manifest(directory: Path) -> Dict[str, FileRecord]:
+    path = directory / MANIFEST_FILENAME
+    if not path.exists():
+        return {}
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    return {name: FileRecord(**record) for name, record in payload.get("files", {}).items()}
+
+
+def save_manifest(directory: Path, records: Dict[str, FileRecord]) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": MANIFEST_VERSION,
+        "files": {name: asdict(records[name]) for name in sorted(records)},
+    }
+    # Write-then-rename so a crash never leaves a half-written manifest behind
+    tmp_path = directory / (MANIFEST_FILENAME + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, directory / MANIFEST_FILENAME)
+
+
+def _is_current(settings: RAGSettings, record: FileRecord, sha256: str) -> bool:
+    return (
+        record.sha256 == sha256
+        and record.chunk_size == settings.chunk_size
+        and record.chunk_overlap == settings.chunk_overlap
+        and record.chunker == chunker_spec(settings)
+        and record.embedding_model == settings.embedding_model_name
+    )
+
+
+def plan_ingestion(
+    settings: RAGSettings, manifest: Dict[str, FileRecord], pdf_paths: Iterable[Path]
+) -> IngestPlan:
+    plan = IngestPlan()
+    seen = set()
+    for pdf_path in pdf_paths:
+        key = manifest_key(settings, pdf_path)
+        seen.add(key)
+        sha256 = file_sha256(pdf_path)
+        plan.hashes[key] = sha256
+        record = manifest.get(key)
+        if record is None:
+            plan.new.append(pdf_path)
+        elif _is_current(settings, record, sha256):
+            plan.unchanged.append(pdf_path)
+        else:
+            plan.changed.append(pdf_path)
+    plan.removed = sorted(set(manifest) - seen)
+    return plan
+
+
+def stale_chunk_ids(
+    settings: RAGSettings,
+    plan: IngestPlan,
+    manifest: Dict[str, FileRecord],
+    index_ids: Iterable[str],
+) -> Set[str]:
+    # Everything in the index that neither belongs to an unchanged file nor will be
+    # (re)produced by this run: chunks of changed/removed files, leftovers of
+    # interrupted runs and ids from indexes built before the manifest existed.
+    keep = {
+        chunk_id
+        for pdf_path in plan.unchanged
+        for chunk_id in manifest[manifest_key(settings, pdf_path)].chunk_ids
+    }
+    prefixes = tuple(
+        chunk_id_prefix(settings, plan.hashes[manifest_key(settings, pdf_path)]) + "-"
+        for pdf_path in plan.to_embed
+    )
+    return {
+        chunk_id
+        for chunk_id in index_ids
+        if chunk_id not in keep and not chunk_id.startswith(prefixes)
+    }
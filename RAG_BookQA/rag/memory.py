@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from .cache import LRUCache
+
+
+# (question, answer)
+Turn = Tuple[str, str]
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation about books with the new turns below. "
+    "Keep names, topics and facts a follow-up question might refer to. "
+    "Write in the language of the conversation, in at most {words} words.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # Tokenizer-free estimate of ~4 UTF-8 bytes per token. Bangla takes 3 bytes per
+    # character, so it is overestimated, which errs on the side of a shorter prompt.
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    max_bytes = max_tokens * 4
+    data = text.encode("utf-8")
+    return text if len(data) <= max_bytes else data[:max_bytes].decode("utf-8", errors="ignore")
+
+
+@dataclass
+class ConversationHistory:
+    # Recent turns kept within a token budget. Turns pushed out of the budget are
+    # queued in `evicted` until they are folded into `summary` (or discarded).
+    token_budget: int
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+    evicted: List[Turn] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def messages(self) -> List[BaseMessage]:
+        with self.lock:
+            messages: List[BaseMessage] = []
+            if self.summary:
+                messages.append(SystemMessage("Summary of the earlier conversation: " + self.summary))
+            for question, answer in self.turns:
+                messages.append(HumanMessage(question))
+                messages.append(AIMessage(answer))
+            return messages
+
+    def add_turn(self, question: str, answer: str) -> None:
+        with self.lock:
+            self.turns.append((question, answer))
+            # Keep the newest turns that fit alongside the summary
+            used = estimate_tokens(self.summary) if self.summary else 0
+            keep = 0
+            for q, a in reversed(self.turns):
+                used += estimate_tokens(q) + estimate_tokens(a)
+                if used > self.token_budget:
+                    break
+                keep += 1
+            cut = len(self.turns) - keep
+            self.evicted.extend(self.turns[:cut])
+            del self.turns[:cut]
+
+    def take_evicted(self) -> List[Turn]:
+        with self.lock:
+            evicted, self.evicted = self.evicted, []
+            return evicted
+
+    def set_summary(self, summary: str) -> None:
+        # The summary shares the budget with recent turns; cap it at half
+        with self.lock:
+            self.summary = _clip(summary.strip(), self.token_budget // 2)
+
+
+def _summary_prompt(history: ConversationHistory, turns: List[Turn]) -> str:
+    return SUMMARY_PROMPT.format(
+        words=max(history.token_budget // 4, 20),
+        summary=history.summary or "(none)",
+        turns="\n".join(f"Human: {q}\nAssistant: {a}" for q, a in turns),
+    )
+
+
+def summarize_evicted(llm: BaseChatModel, history: ConversationHistory) -> None:
+    turns = history.take_evicted()
+    if turns:
+        history.set_summary(llm.invoke(_summary_prompt(history, turns)).text())
+
+
+async def asummarize_evicted(llm: BaseChatModel, history: ConversationHistory) -> None:
+    turns = history.take_evicted()
+    if turns:
+        history.set_summary((await llm.ainvoke(_summary_prompt(history, turns))).text())
+
+
+class SessionStore:
+    # Conversation histories by session id. Sessions are evicted least recently used
+    # first, and expire once idle for `idle_ttl` seconds.
+    def __init__(self, max_sessions: int, idle_ttl: float, token_budget: int) -> None:
+        self.token_budget = token_budget
+        self._sessions: LRUCache[ConversationHistory] = LRUCache(max_sessions, idle_ttl)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationHistory:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = ConversationHistory(self.token_budget)
+            # Re-inserting restarts the idle timer
+            self._sessions.put(session_id, history)
+            return history
+
+    def drop(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._sessions.stats()
+        stats["token_budget"] = self.token_budget
+        return stats
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+# Process-wide stage timings in Prometheus text format, plus per-request totals for the
+# Server-Timing header. Everything is a no-op until configure(True) is called.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# LLM calls are tagged "rag_<stage>"; untagged calls are timed as "llm"
+LLM_TAG_PREFIX = "rag_"
+
+_enabled = False
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("rag_request_timings", default=None)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        # label values -> (cumulative bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            buckets, total, count = self._series.get(labels) or ([0] * len(BUCKETS), 0.0, 0)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            self._series[labels] = (buckets, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, (buckets, total, count) in series:
+            for bound, bucket in zip(BUCKETS, buckets):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {bucket}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values)
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+REQUEST_SECONDS = Histogram("rag_request_seconds", "HTTP request latency by route.", ["path"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens by stage and kind.", ["stage", "kind"])
+
+
+def configure(enabled: bool) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def record(stage_name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe((stage_name,), seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage_name] = timings.get(stage_name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        record(self.name, time.perf_counter() - self.started)
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def stage(name: str):
+    # `with stage("embed"): ...` times the block; a shared no-op when metrics are off
+    return _Stage(name) if _enabled else _NOOP
+
+
+def start_request() -> Token:
+    return _request_timings.set({})
+
+
+def end_request(token: Token) -> Dict[str, float]:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class LLMTimer(BaseCallbackHandler):
+    # Times chat model calls and counts their tokens, by "rag_<stage>" tag.
+    # Runs inline so it sees the request's context (and costs no executor hop).
+    run_inline = True
+
+    def __init__(self) -> None:
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+
+    @staticmethod
+    def _stage(tags: Optional[List[str]]) -> str:
+        for tag in tags or []:
+            if tag.startswith(LLM_TAG_PREFIX):
+                return tag[len(LLM_TAG_PREFIX):]
+        return "llm"
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any
+    ) -> None:
+        self._started[run_id] = (self._stage(tags), time.perf_counter())
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs: Any
+    ) -> None:
+        self._started[run_id] = (self._stage(tags), time.perf_counter())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        stage_name, t0 = started
+        record(stage_name, time.perf_counter() - t0)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.inc((stage_name, "prompt"), usage.get("input_tokens", 0))
+                    LLM_TOKENS.inc((stage_name, "completion"), usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+
+
+LLM_TIMER = LLMTimer()
+
+
+def _cache_lines(caches: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = [
+        "# HELP rag_cache_hits_total Cache hits.",
+        "# TYPE rag_cache_hits_total counter",
+    ]
+    lines += [f'rag_cache_hits_total{{cache="{name}"}} {s.get("hits", 0)}' for name, s in caches.items()]
+    lines += ["# HELP rag_cache_misses_total Cache misses.", "# TYPE rag_cache_misses_total counter"]
+    lines += [f'rag_cache_misses_total{{cache="{name}"}} {s.get("misses", 0)}' for name, s in caches.items()]
+    lines += ["# HELP rag_cache_hit_ratio Cache hit ratio since start.", "# TYPE rag_cache_hit_ratio gauge"]
+    lines += [f'rag_cache_hit_ratio{{cache="{name}"}} {s.get("hit_rate", 0.0)}' for name, s in caches.items()]
+    lines += ["# HELP rag_cache_entries Entries currently cached.", "# TYPE rag_cache_entries gauge"]
+    lines += [f'rag_cache_entries{{cache="{name}"}} {s.get("entries", 0)}' for name, s in caches.items()]
+    return lines
+
+
+def render(caches: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render() + LLM_TOKENS.render()
+    if caches:
+        lines += _cache_lines(caches)
+    return "\n".join(lines) + "\n"
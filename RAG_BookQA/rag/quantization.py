@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+
+# Scalar quantization of a saved index. The FAISS index then holds fp16 or int8 codes
+# (2x / 4x smaller than float32) and the exact vectors are kept in vectors.npy, which
+# is memory-mapped: a search only pages in the rows it re-ranks. Ingestion always
+# works on float32 vectors; the quantized copy is made when the index is saved.
+QUANTIZATIONS = ("none", "fp16", "int8")
+VECTORS_FILENAME = "vectors.npy"
+_SQ_CODES = {"fp16": "SQfp16", "int8": "SQ8"}
+
+
+def vectors_path(directory: Path) -> Path:
+    return directory / VECTORS_FILENAME
+
+
+def write_vectors(directory: Path, vectors: np.ndarray) -> None:
+    tmp_path = directory / (VECTORS_FILENAME + ".tmp")
+    with tmp_path.open("wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, vectors_path(directory))
+
+
+def index_quantization(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "none"
+
+
+def index_vectors(index) -> np.ndarray:
+    # The vectors of a float32 flat, IVF-flat or HNSW index, in position order
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), np.float32)
+    # IVF lists are read directly; sorting by label also closes the gaps removals leave
+    ids, codes = [], []
+    for list_no in range(ivf.nlist):
+        size = ivf.invlists.list_size(list_no)
+        if size:
+            ids.append(faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), size).copy())
+            codes.append(faiss.rev_swig_ptr(ivf.invlists.get_codes(list_no), size * ivf.code_size).copy())
+    if not ids:
+        return np.zeros((0, index.d), np.float32)
+    vectors = np.concatenate(codes).view(np.float32).reshape(-1, index.d)
+    return vectors[np.argsort(np.concatenate(ids), kind="stable")]
+
+
+def _like(index, storage: str):
+    # An empty index with the structure of `index` (HNSW degree, IVF centroids) and
+    # the given vector storage; works from a float32 or a quantized template
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.index_factory(index.d, f"HNSW{index.hnsw.nb_neighbors(1)},{storage}", index.metric_type)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return faiss.index_factory(index.d, storage, index.metric_type)
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        raise ValueError("ivf_pq indexes are already compressed; VECTOR_QUANTIZATION applies to flat, ivf_flat and hnsw")
+    new = faiss.index_factory(index.d, f"IVF{ivf.nlist},{storage}", index.metric_type)
+    # Same coarse centroids, so nothing is re-clustered
+    new.quantizer.add(ivf.quantizer.reconstruct_n(0, ivf.nlist))
+    if storage == "Flat":
+        new.is_trained = True
+    return new
+
+
+def quantize_index(index, vectors: np.ndarray, quantization: str):
+    quantized = _like(index, _SQ_CODES[quantization])
+    if not quantized.is_trained:
+        # int8 learns per-dimension ranges; IVF skips k-means since its centroids are set
+        quantized.train(vectors)
+    quantized.add(vectors)
+    return quantized
+
+
+def exact_index(index, vectors: np.ndarray):
+    # The float32 counterpart of a quantized index, for ingestion to add to and delete from
+    exact = _like(index, "Flat")
+    exact.add(vectors)
+    return exact
+
+
+class RerankedIndex:
+    # Wraps a quantized index for search: each query fetches factor * k candidates from
+    # the codes, re-scores them against the exact vectors and keeps the best k. A batch
+    # of queries is one FAISS call and one vectorized numpy pass.
+    def __init__(self, index, vectors: np.ndarray, factor: int) -> None:
+        self.index = index
+        self.vectors = vectors
+        self.factor = factor
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    @property
+    def metric_type(self) -> int:
+        return self.index.metric_type
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        _, candidates = self.index.search(x, k * self.factor)
+        valid = candidates >= 0
+        # (queries, candidates, dim), read from the memory map
+        exact = self.vectors[np.where(valid, candidates, 0)]
+        dots = np.einsum("qcd,qd->qc", exact, x)
+        if self.metric_type == faiss.METRIC_INNER_PRODUCT:
+            scores = np.where(valid, dots, -np.inf)
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        else:
+            # Squared L2, like FAISS: |v|^2 - 2 v.q + |q|^2
+            norms = np.einsum("qcd,qcd->qc", exact, exact)
+            distances = np.maximum(norms - 2 * dots + np.einsum("qd,qd->q", x, x)[:, None], 0)
+            scores = np.where(valid, distances, np.inf)
+            order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+        labels = np.take_along_axis(candidates, order, axis=1)
+        labels[~np.take_along_axis(valid, order, axis=1)] = -1
+        return np.take_along_axis(scores, order, axis=1).astype(np.float32), labels
@@ -1,13 +1,291 @@
 from __future__ import annotations
 
-from typing import List
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
 
+from .cache import LRUCache
 from .config import RAGSettings
+from .context import ContextPacker, create_context_packer
+from .embedding_cache import embed_queries, normalize_text
+from .metrics import stage
+from .sparse import CorpusStats, SparseIndex, reciprocal_rank_fusion
+from .vectorstore import read_index_version, sparse_index_is_current
 
 
-def create_retriever(settings: RAGSettings, vector_store: FAISS):
-    return vector_store.as_retriever(search_kwargs={"k": settings.retrieval_k})
+# Cached per question: the query embedding plus the top-k (docstore id, score) hits
+CacheEntry = Tuple[List[float], List[Tuple[str, float]]]
 
+# What the "score" in a hit's metadata measures, reported with it as "score_kind":
+# the FAISS L2 distance (lower is better) or the fused RRF score (higher is better)
+SCORE_L2 = "l2"
+SCORE_RRF = "rrf"
 
+# BM25 runs here while the calling thread embeds the question and searches FAISS
+_SPARSE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+
+class CachedRetriever(BaseRetriever):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: FAISS
+    k: int
+    index_version: str = ""
+    cache: LRUCache
+    sparse_index: Optional[SparseIndex] = None
+    candidates: int = 20
+    rrf_k: int = 60
+    packer: Optional[ContextPacker] = None
+
+    def _cache_key(self, query: str) -> Tuple[str, str]:
+        return self.index_version, normalize_text(query).casefold()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.vector_store.embedding_function
+
+    @property
+    def score_kind(self) -> str:
+        return SCORE_RRF if self.sparse_index is not None else SCORE_L2
+
+    def _cache_id(self, doc: Document) -> str:
+        return doc.id
+
+    def _lookup(self, cache_id: str) -> Optional[Document]:
+        doc = self.vector_store.docstore.search(cache_id)
+        return doc if isinstance(doc, Document) else None
+
+    def _cached_hits(self, entry: CacheEntry) -> Optional[List[Tuple[Document, float]]]:
+        # None when a cached hit is gone from the docstore
+        hits = [(self._lookup(cache_id), score) for cache_id, score in entry[1]]
+        return hits if all(doc is not None for doc, _ in hits) else None
+
+    def _embed(self, query: str, embedding: Optional[List[float]]) -> List[float]:
+        if embedding is not None:
+            return embedding
+        with stage("embed"):
+            return self.embeddings.embed_query(query)
+
+    def _sparse_search(self, query: str, depth: int, stats: Optional[CorpusStats] = None) -> List[Tuple[int, float]]:
+        with stage("bm25"):
+            return self.sparse_index.search(query, depth, stats)
+
+    def _submit_sparse(self, query: str, depth: int, stats: Optional[CorpusStats] = None) -> Future:
+        # Run in a copy of the caller's context so the timing lands on its request
+        return _SPARSE_POOL.submit(contextvars.copy_context().run, self._sparse_search, query, depth, stats)
+
+    def _hybrid_search(
+        self, query: str, embedding: Optional[List[float]]
+    ) -> Tuple[List[float], List[Tuple[Document, float]]]:
+        depth = max(self.candidates, self.k)
+        sparse_future = self._submit_sparse(query, depth)
+        embedding = self._embed(query, embedding)
+        with stage("search"):
+            dense = self.vector_store.similarity_search_with_score_by_vector(embedding, k=depth)
+        return embedding, self._fuse(dense, sparse_future.result())
+
+    def _fuse(
+        self, dense: List[Tuple[Document, float]], sparse: List[Tuple[int, float]]
+    ) -> List[Tuple[Document, float]]:
+        docs = {doc.id: doc for doc, _ in dense}
+        sparse_ids = [self.vector_store.index_to_docstore_id[row] for row, _ in sparse]
+        fused = reciprocal_rank_fusion([[doc.id for doc, _ in dense], sparse_ids], k=self.rrf_k)
+        results = []
+        for doc_id, score in fused[: self.k]:
+            doc = docs.get(doc_id) or self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                results.append((doc, score))
+        return results
+
+    def _sparse_docs(self, sparse: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        hits = []
+        for row, score in sparse:
+            doc = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[row])
+            if isinstance(doc, Document):
+                hits.append((doc, score))
+        return hits
+
+    def corpus_stats(self, texts: List[str]) -> List[Optional[CorpusStats]]:
+        if self.sparse_index is None:
+            return [None] * len(texts)
+        return [self.sparse_index.corpus_stats(text) for text in texts]
+
+    def _candidates(
+        self, query: str, embedding: List[float], depth: int, stats: Optional[CorpusStats] = None
+    ) -> Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]:
+        # Unfused dense hits (L2 distance) and BM25 hits (score), each `depth` deep;
+        # a ShardedRetriever merges these across shards and fuses them once
+        sparse_future = self._submit_sparse(query, depth, stats) if self.sparse_index is not None else None
+        with stage("search"):
+            dense = self.vector_store.similarity_search_with_score_by_vector(embedding, k=depth)
+        return dense, self._sparse_docs(sparse_future.result()) if sparse_future is not None else []
+
+    def _candidates_batch(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        depth: int,
+        stats: Optional[List[Optional[CorpusStats]]] = None,
+    ) -> List[Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]]:
+        stats = stats or [None] * len(texts)
+        sparse_futures = [
+            self._submit_sparse(text, depth, text_stats) if self.sparse_index is not None else None
+            for text, text_stats in zip(texts, stats)
+        ]
+        dense = self._dense_batch(embeddings, depth)
+        return [
+            (hits, self._sparse_docs(future.result()) if future is not None else [])
+            for hits, future in zip(dense, sparse_futures)
+        ]
+
+    def _dense_batch(
+        self, embeddings: List[List[float]], depth: int
+    ) -> List[List[Tuple[Document, float]]]:
+        # One matrix search instead of a FAISS call per question
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(vectors)
+        with stage("search"):
+            scores, positions = self.vector_store.index.search(vectors, depth)
+        results = []
+        for row_scores, row_positions in zip(scores, positions):
+            hits = []
+            for score, position in zip(row_scores, row_positions):
+                if position == -1:
+                    continue
+                doc = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[int(position)])
+                if isinstance(doc, Document):
+                    hits.append((doc, float(score)))
+            results.append(hits)
+        return results
+
+    def _search(
+        self, query: str, embedding: Optional[List[float]]
+    ) -> Tuple[List[float], List[Tuple[Document, float]]]:
+        if self.sparse_index is not None:
+            return self._hybrid_search(query, embedding)
+        embedding = self._embed(query, embedding)
+        with stage("search"):
+            return embedding, self.vector_store.similarity_search_with_score_by_vector(embedding, k=self.k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        key = self._cache_key(query)
+        entry: Optional[CacheEntry] = self.cache.get(key)
+        embedding: Optional[List[float]] = None
+        if entry is not None:
+            embedding = entry[0]
+            hits = self._cached_hits(entry)
+            if hits is not None:
+                return self._finish(hits, embedding)
+            # The docstore changed underneath us: keep the embedding, search again
+
+        embedding, results = self._search(query, embedding)
+        self._store(key, embedding, results)
+        return self._finish(results, embedding)
+
+    def _store(self, key: Tuple[str, str], embedding: List[float], hits: List[Tuple[Document, float]]) -> None:
+        self.cache.put(key, (embedding, [(self._cache_id(doc), float(score)) for doc, score in hits]))
+
+    def _finish(self, hits: List[Tuple[Document, float]], embedding: List[float]) -> List[Document]:
+        docs = [_with_score(doc, score, self.score_kind) for doc, score in hits]
+        if self.packer is None:
+            return docs
+        with stage("pack"):
+            return self.packer.pack(docs, embedding)
+
+    def batch_retrieve(self, queries: Sequence[str]) -> Tuple[List[List[Document]], List[List[float]]]:
+        # Returns the documents and the query embedding of every query. Cached
+        # questions are served from the cache; the rest are embedded in one batched
+        # call and searched together, with BM25 running alongside.
+        results: Dict[Tuple[str, str], Tuple[List[Document], List[float]]] = {}
+        pending: Dict[Tuple[str, str], str] = {}
+        for query in queries:
+            key = self._cache_key(query)
+            if key in results or key in pending:
+                continue
+            entry: Optional[CacheEntry] = self.cache.get(key)
+            if entry is not None:
+                hits = self._cached_hits(entry)
+                if hits is not None:
+                    results[key] = self._finish(hits, entry[0]), entry[0]
+                    continue
+            pending[key] = query
+
+        if pending:
+            embeddings, found = self._search_batch(list(pending.values()))
+            for key, embedding, hits in zip(pending, embeddings, found):
+                self._store(key, embedding, hits)
+                results[key] = self._finish(hits, embedding), embedding
+        ordered = [results[self._cache_key(query)] for query in queries]
+        return [docs for docs, _ in ordered], [embedding for _, embedding in ordered]
+
+    def _search_batch(
+        self, texts: List[str], embeddings: Optional[List[List[float]]] = None
+    ) -> Tuple[List[List[float]], List[List[Tuple[Document, float]]]]:
+        depth = max(self.candidates, self.k) if self.sparse_index is not None else self.k
+        sparse_futures = (
+            [self._submit_sparse(text, depth) for text in texts]
+            if self.sparse_index is not None
+            else []
+        )
+        if embeddings is None:
+            with stage("embed"):
+                embeddings = embed_queries(self.embeddings, texts)
+        dense = self._dense_batch(embeddings, depth)
+        if sparse_futures:
+            return embeddings, [self._fuse(hits, future.result()) for hits, future in zip(dense, sparse_futures)]
+        return embeddings, dense
+
+    def embed_query(self, query: str) -> List[float]:
+        entry: Optional[CacheEntry] = self.cache.get(self._cache_key(query))
+        return self._embed(query, entry[0] if entry is not None else None)
+
+    def invalidate(self, index_version: Optional[str] = None) -> None:
+        if index_version is not None:
+            self.index_version = index_version
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"index_version": self.index_version, **self.cache.stats()}
+
+
+def _with_score(doc: Document, score: float, score_kind: str) -> Document:
+    # Copy so the score never leaks into the shared docstore entry
+    return Document(
+        id=doc.id,
+        page_content=doc.page_content,
+        metadata={**doc.metadata, "score": float(score), "score_kind": score_kind},
+    )
+
+
+def _load_sparse_index(settings: RAGSettings, vector_store: FAISS) -> Optional[SparseIndex]:
+    # A BM25 index from an earlier save (e.g. next to a checkpoint) has other rows
+    if settings.retrieval_mode != "hybrid" or not sparse_index_is_current(settings.vectorstore_dir):
+        return None
+    sparse_index = SparseIndex(settings.vectorstore_dir)
+    # Rows must line up with FAISS positions; a mismatch means the index on disk moved on
+    return sparse_index if len(sparse_index) == vector_store.index.ntotal else None
+
+
+def create_retriever(settings: RAGSettings, vector_store: FAISS) -> CachedRetriever:
+    return CachedRetriever(
+        vector_store=vector_store,
+        k=settings.retrieval_k,
+        index_version=read_index_version(settings.vectorstore_dir),
+        cache=LRUCache(settings.retriever_cache_size, settings.retriever_cache_ttl),
+        sparse_index=_load_sparse_index(settings, vector_store),
+        candidates=settings.hybrid_candidates,
+        rrf_k=settings.rrf_k,
+        packer=create_context_packer(settings, vector_store.embedding_function),
+    )
@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from .cache import LRUCache
+from .config import RAGSettings
+from .context import create_context_packer
+from .embedding_cache import embed_queries
+from .embeddings import create_embeddings
+from .manifest import manifest_key
+from .metrics import stage
+from .retriever import SCORE_L2, SCORE_RRF, CachedRetriever, create_retriever
+from .sparse import CorpusStats, merge_corpus_stats, reciprocal_rank_fusion
+from .vectorstore import load_faiss_index, read_index_version
+
+
+# One FAISS index (with its manifest and BM25 index) per book or per collection,
+# under vectorstore/shards/<name>/, described by vectorstore/catalog.json.
+CATALOG_FILENAME = "catalog.json"
+CATALOG_VERSION = 1
+SHARDS_DIRNAME = "shards"
+SHARD_MODES = ("none", "book", "collection")
+# Collection of PDFs directly in data/pdfs; subfolders of data/pdfs are collections
+DEFAULT_COLLECTION = "default"
+
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+# Searches over several shards run here, one task per shard
+_SHARD_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard")
+
+# One shard's unfused (dense, BM25) hits for a question
+Candidates = Tuple[List[Tuple[Document, float]], List[Tuple[Document, float]]]
+
+
+@dataclass
+class ShardInfo:
+    collection: str
+    books: List[str] = field(default_factory=list)
+    chunks: int = 0
+    version: str = ""
+    index_type: str = ""
+    quantization: str = "none"
+
+
+def shards_dir(directory: Path) -> Path:
+    return directory / SHARDS_DIRNAME
+
+
+def shard_dir(directory: Path, name: str) -> Path:
+    return shards_dir(directory) / name
+
+
+def shard_settings(settings: RAGSettings, name: str) -> RAGSettings:
+    # The single-index code paths work on a shard once vectorstore_dir points at it
+    return replace(settings, vectorstore_dir=shard_dir(settings.vectorstore_dir, name))
+
+
+def book_collection(settings: RAGSettings, pdf_path: Path) -> str:
+    parts = Path(manifest_key(settings, pdf_path)).parts
+    return parts[0] if len(parts) > 1 else DEFAULT_COLLECTION
+
+
+def book_name(key: str) -> str:
+    return Path(key).stem
+
+
+def shard_name(settings: RAGSettings, pdf_path: Path) -> str:
+    if settings.shard_by == "collection":
+        name = book_collection(settings, pdf_path)
+    elif settings.shard_by == "book":
+        name = "__".join(Path(manifest_key(settings, pdf_path)).with_suffix("").parts)
+    else:
+        raise ValueError(f"Unknown SHARD_BY {settings.shard_by!r}; expected one of {', '.join(SHARD_MODES)}")
+    return _UNSAFE_RE.sub("_", name).strip("._") or "_"
+
+
+def catalog_exists(directory: Path) -> bool:
+    return (directory / CATALOG_FILENAME).exists()
+
+
+def _read_catalog(directory: Path) -> Dict[str, Any]:
+    path = directory / CATALOG_FILENAME
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def load_catalog(directory: Path) -> Dict[str, ShardInfo]:
+    payload = _read_catalog(directory)
+    return {name: ShardInfo(**info) for name, info in payload.get("shards", {}).items()}
+
+
+def catalog_shard_by(directory: Path) -> Optional[str]:
+    return _read_catalog(directory).get("shard_by")
+
+
+def save_catalog(directory: Path, shard_by: str, shards: Dict[str, ShardInfo]) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "version": CATALOG_VERSION,
+        "shard_by": shard_by,
+        "shards": {name: asdict(shards[name]) for name in sorted(shards)},
+    }
+    # Write-then-rename, like the manifest: readers never see a half-written catalog
+    tmp_path = directory / (CATALOG_FILENAME + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, directory / CATALOG_FILENAME)
+
+
+def delete_catalog(directory: Path) -> None:
+    (directory / CATALOG_FILENAME).unlink(missing_ok=True)
+    shutil.rmtree(shards_dir(directory), ignore_errors=True)
+
+
+def catalog_version(shards: Dict[str, ShardInfo]) -> str:
+    # Changes whenever any shard is re-saved, so caches keyed on it drop stale entries
+    digest = hashlib.sha256()
+    for name in sorted(shards):
+        digest.update(f"{name}:{shards[name].version}\n".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def select_shards(
+    shards: Dict[str, ShardInfo], book: Optional[str] = None, collection: Optional[str] = None
+) -> List[str]:
+    # A book matches its path under data/pdfs or its shard name, else its file name
+    # (which may be shared by books in different collections)
+    wanted_collection = collection.casefold() if collection else None
+    candidates = {
+        name: info
+        for name, info in shards.items()
+        if wanted_collection is None or info.collection.casefold() == wanted_collection
+    }
+    if not book:
+        return sorted(candidates)
+    wanted = book.casefold()
+    exact = [
+        name
+        for name, info in candidates.items()
+        if name.casefold() == wanted or any(key.casefold() == wanted for key in info.books)
+    ]
+    if exact:
+        return sorted(exact)
+    return sorted(
+        name
+        for name, info in candidates.items()
+        if any(book_name(key).casefold() == wanted for key in info.books)
+    )
+
+
+class ShardManager:
+    # Opens shards on first use and keeps at most max_loaded of them open, closing the
+    # least recently used. Shard indexes are memory-mapped, so an open shard costs
+    # little beyond the pages its searches touch; closing it releases those too.
+    def __init__(
+        self,
+        settings: RAGSettings,
+        catalog: Dict[str, ShardInfo],
+        embeddings: Embeddings,
+        max_loaded: int,
+    ) -> None:
+        self.settings = settings
+        self.catalog = catalog
+        self.embeddings = embeddings
+        self.max_loaded = max_loaded
+        self.loads = 0
+        self.unloads = 0
+        self._loaded: "OrderedDict[str, CachedRetriever]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _open(self, name: str) -> CachedRetriever:
+        settings = shard_settings(self.settings, name)
+        vector_store = load_faiss_index(settings, embeddings=self.embeddings)
+        # Results are cached and packed once, by the ShardedRetriever in front
+        return create_retriever(replace(settings, retriever_cache_size=0, context_token_budget=0), vector_store)
+
+    def get(self, name: str) -> CachedRetriever:
+        if name not in self.catalog:
+            raise KeyError(f"Unknown shard {name!r}")
+        with self._lock:
+            retriever = self._loaded.get(name)
+            if retriever is not None:
+                self._loaded.move_to_end(name)
+                return retriever
+            loading = self._loading.setdefault(name, threading.Lock())
+        # Concurrent first requests for one shard open it once; other shards do not wait
+        with loading:
+            with self._lock:
+                retriever = self._loaded.get(name)
+            if retriever is not None:
+                return retriever
+            retriever = self._open(name)
+            with self._lock:
+                self._loaded[name] = retriever
+                self.loads += 1
+                while self.max_loaded > 0 and len(self._loaded) > self.max_loaded:
+                    self._loaded.popitem(last=False)
+                    self.unloads += 1
+            return retriever
+
+    def adopt(self, previous: "ShardManager") -> int:
+        # Keeps the open shards of an older catalog that this one did not change
+        with previous._lock:
+            candidates = list(previous._loaded.items())
+        adopted = 0
+        with self._lock:
+            for name, retriever in candidates:
+                info, old = self.catalog.get(name), previous.catalog.get(name)
+                if info is not None and old is not None and info.version == old.version:
+                    self._loaded[name] = retriever
+                    adopted += 1
+        return adopted
+
+    def unload(self, name: str) -> bool:
+        # Searches already running on the shard finish on their own reference
+        with self._lock:
+            removed = self._loaded.pop(name, None) is not None
+            self.unloads += removed
+            return removed
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shards": len(self.catalog),
+            "loaded": len(self._loaded),
+            "max_loaded": self.max_loaded,
+            "loads": self.loads,
+            "unloads": self.unloads,
+        }
+
+
+def _in_shard(doc: Document, name: str) -> Document:
+    return Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "shard": name})
+
+
+class ShardedRetriever(CachedRetriever):
+    # Searches the selected shards (all by default) in parallel and keeps the best k
+    # hits overall. Every shard shares one embedding model, so the question is
+    # embedded once. Dense hits of all shards are merged by L2 distance. RRF scores
+    # depend on ranks within one shard and are not comparable across shards, so in
+    # hybrid mode each shard returns its unfused dense and BM25 candidates. BM25 is
+    # scored with the statistics of all searched shards together, so its hits are
+    # merged by score, and RRF runs once over the two merged rankings.
+    vector_store: Optional[FAISS] = None
+    manager: ShardManager
+    shards: Optional[List[str]] = None
+    catalog_version: str = ""
+    hybrid: bool = False
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.manager.embeddings
+
+    @property
+    def score_kind(self) -> str:
+        return SCORE_RRF if self.hybrid else SCORE_L2
+
+    def scoped(self, names: Sequence[str]) -> "ShardedRetriever":
+        # Shares the manager and caches; the version keeps scoped results apart
+        names = sorted(names)
+        return self.model_copy(
+            update={"shards": names, "index_version": f"{self.catalog_version}:{'+'.join(names)}"}
+        )
+
+    def _names(self) -> List[str]:
+        return self.shards if self.shards is not None else sorted(self.manager.catalog)
+
+    def _cache_id(self, doc: Document) -> str:
+        return f"{doc.metadata['shard']}/{doc.id}"
+
+    def _lookup(self, cache_id: str) -> Optional[Document]:
+        name, _, doc_id = cache_id.partition("/")
+        try:
+            doc = self.manager.get(name)._lookup(doc_id)
+        except (KeyError, FileNotFoundError):
+            return None
+        return _in_shard(doc, name) if doc is not None else None
+
+    def _fan_out(self, search: Callable[[CachedRetriever], Any]) -> List[Tuple[str, Any]]:
+        names = self._names()
+        if len(names) == 1:
+            return [(names[0], search(self.manager.get(names[0])))]
+
+        def _run(name: str) -> Any:
+            return search(self.manager.get(name))
+
+        # Each task runs in a copy of the caller's context so its timings land on the request
+        futures = [(name, _SHARD_POOL.submit(contextvars.copy_context().run, _run, name)) for name in names]
+        return [(name, future.result()) for name, future in futures]
+
+    def _corpus_stats(self, texts: List[str]) -> List[Optional[CorpusStats]]:
+        # BM25 statistics of the searched shards together, one per text
+        if not self.hybrid:
+            return [None] * len(texts)
+        per_shard = [stats for _, stats in self._fan_out(lambda shard: shard.corpus_stats(texts))]
+        return [
+            merge_corpus_stats(shard_stats[i] for shard_stats in per_shard if shard_stats[i] is not None)
+            if any(shard_stats[i] is not None for shard_stats in per_shard)
+            else None
+            for i in range(len(texts))
+        ]
+
+    def _depth(self) -> int:
+        return max(self.candidates, self.k) if self.hybrid else self.k
+
+    def _merge(self, per_shard: List[Tuple[str, Candidates]]) -> List[Tuple[Document, float]]:
+        depth = self._depth()
+        dense = [(_in_shard(doc, name), score) for name, (hits, _) in per_shard for doc, score in hits]
+        dense.sort(key=lambda hit: hit[1])
+        if not self.hybrid:
+            return dense[: self.k]
+        sparse = [(_in_shard(doc, name), score) for name, (_, hits) in per_shard for doc, score in hits]
+        sparse.sort(key=lambda hit: hit[1], reverse=True)
+        # Fused even when no selected shard has a BM25 index, so scores stay RRF scores
+        dense, sparse = dense[:depth], sparse[:depth]
+        docs = {self._cache_id(doc): doc for doc, _ in dense + sparse}
+        fused = reciprocal_rank_fusion(
+            [[self._cache_id(doc) for doc, _ in dense], [self._cache_id(doc) for doc, _ in sparse]], k=self.rrf_k
+        )
+        return [(docs[cache_id], score) for cache_id, score in fused[: self.k]]
+
+    def _search(
+        self, query: str, embedding: Optional[List[float]]
+    ) -> Tuple[List[float], List[Tuple[Document, float]]]:
+        embedding = self._embed(query, embedding)
+        depth = self._depth()
+        stats = self._corpus_stats([query])[0]
+        per_shard = self._fan_out(lambda shard: shard._candidates(query, embedding, depth, stats))
+        return embedding, self._merge(per_shard)
+
+    def _search_batch(
+        self, texts: List[str], embeddings: Optional[List[List[float]]] = None
+    ) -> Tuple[List[List[float]], List[List[Tuple[Document, float]]]]:
+        if embeddings is None:
+            with stage("embed"):
+                embeddings = embed_queries(self.embeddings, texts)
+        depth = self._depth()
+        stats = self._corpus_stats(texts)
+        per_shard = self._fan_out(lambda shard: shard._candidates_batch(texts, embeddings, depth, stats))
+        return embeddings, [
+            self._merge([(name, found[i]) for name, found in per_shard]) for i in range(len(texts))
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "shards": self.manager.stats()}
+
+
+def create_sharded_retriever(
+    settings: RAGSettings, catalog: Dict[str, ShardInfo], previous: Optional[ShardManager] = None
+) -> ShardedRetriever:
+    if not catalog:
+        raise FileNotFoundError(f"The shard catalog in {settings.vectorstore_dir} lists no shards")
+    embeddings = previous.embeddings if previous is not None else create_embeddings(settings)
+    version = catalog_version(catalog)
+    manager = ShardManager(settings, catalog, embeddings, settings.shard_max_loaded)
+    if previous is not None:
+        manager.adopt(previous)
+    return ShardedRetriever(
+        manager=manager,
+        k=settings.retrieval_k,
+        index_version=version,
+        catalog_version=version,
+        cache=LRUCache(settings.retriever_cache_size, settings.retriever_cache_ttl),
+        candidates=settings.hybrid_candidates,
+        rrf_k=settings.rrf_k,
+        packer=create_context_packer(settings, embeddings),
+        hybrid=settings.retrieval_mode == "hybrid",
+    )
+
+
+def load_retriever(settings: RAGSettings, previous: Optional[CachedRetriever] = None) -> CachedRetriever:
+    # A shard catalog wins over a single index left over from before sharding.
+    # When reloading, pass the current retriever: unchanged shards stay open.
+    if catalog_exists(settings.vectorstore_dir):
+        manager = previous.manager if isinstance(previous, ShardedRetriever) else None
+        return create_sharded_retriever(settings, load_catalog(settings.vectorstore_dir), manager)
+    return create_retriever(settings, load_faiss_index(settings))
+
+
+def current_index_version(settings: RAGSettings) -> str:
+    # The index_version load_retriever would give an unfiltered retriever right now;
+    # cheap enough to poll
+    if catalog_exists(settings.vectorstore_dir):
+        return catalog_version(load_catalog(settings.vectorstore_dir))
+    return read_index_version(settings.vectorstore_dir)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import shutil
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .utils import load_npy, replace_dir
+
+
+# BM25 inverted index stored next to the FAISS index. Row i is the chunk at FAISS
+# position i, so sparse hits map to docstore ids the same way dense hits do.
+#
+#   vocab.json        term -> term id
+#   term_offsets.npy  int64[V + 1] slice of the postings arrays for each term
+#   postings.npy      int32[nnz] rows containing the term, grouped by term
+#   tfs.npy           uint16[nnz] term frequency in that row
+#   doc_len.npy       int32[n] tokens per row
+#   INDEX_VERSION     VERSION of the FAISS index these rows belong to
+SPARSE_DIRNAME = "sparse"
+INDEX_VERSION_FILENAME = "INDEX_VERSION"
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Bengali block (letters, vowel signs, digits) or ASCII alphanumerics. The danda
+# (U+0964) and double danda (U+0965) sit outside both ranges, so they split tokens
+# just like Latin punctuation does.
+_TOKEN_RE = re.compile(r"[\u0980-\u09FF]+|[a-z0-9]+")
+# Zero-width (non-)joiners only shape Bangla conjuncts; drop them so both spellings match
+_JOINERS_RE = re.compile(r"[\u200c\u200d]")
+
+
+@dataclass(frozen=True)
+class CorpusStats:
+    # What BM25 needs beyond a row's own term counts. Summed over shards, it gives
+    # every shard the IDF and average length of the whole corpus, which makes their
+    # scores comparable.
+    rows: int
+    tokens: int
+    doc_freqs: Dict[str, int]
+
+
+def merge_corpus_stats(parts: Iterable[CorpusStats]) -> CorpusStats:
+    rows, tokens, doc_freqs = 0, 0, Counter()
+    for part in parts:
+        rows += part.rows
+        tokens += part.tokens
+        doc_freqs.update(part.doc_freqs)
+    return CorpusStats(rows, tokens, dict(doc_freqs))
+
+
+def tokenize(text: str) -> List[str]:
+    text = _JOINERS_RE.sub("", unicodedata.normalize("NFC", text)).casefold()
+    return _TOKEN_RE.findall(text)
+
+
+def sparse_dir(directory: Path) -> Path:
+    return directory / SPARSE_DIRNAME
+
+
+def sparse_index_exists(directory: Path) -> bool:
+    return (sparse_dir(directory) / "term_offsets.npy").exists()
+
+
+def sparse_index_version(directory: Path) -> str:
+    path = sparse_dir(directory) / INDEX_VERSION_FILENAME
+    return path.read_text(encoding="utf-8").strip() if path.exists() else ""
+
+
+def stamp_sparse_index(directory: Path, index_version: str) -> None:
+    # For a FAISS index re-saved with the same rows (e.g. re-quantized)
+    (sparse_dir(directory) / INDEX_VERSION_FILENAME).write_text(index_version, encoding="utf-8")
+
+
+def write_sparse_index(directory: Path, texts: Iterable[str], index_version: str) -> None:
+    vocab: Dict[str, int] = {}
+    rows: List[List[int]] = []
+    row_tfs: List[List[int]] = []
+    doc_len: List[int] = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            term_id = vocab.setdefault(term, len(vocab))
+            if term_id == len(rows):
+                rows.append([])
+                row_tfs.append([])
+            rows[term_id].append(row)
+            row_tfs[term_id].append(min(tf, np.iinfo(np.uint16).max))
+
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum([len(r) for r in rows])
+    nnz = int(term_offsets[-1])
+    postings = np.fromiter((r for term_rows in rows for r in term_rows), dtype=np.int32, count=nnz)
+    tfs = np.fromiter((t for term_tfs in row_tfs for t in term_tfs), dtype=np.uint16, count=nnz)
+
+    target = sparse_dir(directory)
+    tmp = directory / (SPARSE_DIRNAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    (tmp / "vocab.json").write_text(json.dumps(vocab, ensure_ascii=False), encoding="utf-8")
+    np.save(tmp / "term_offsets.npy", term_offsets)
+    np.save(tmp / "postings.npy", postings)
+    np.save(tmp / "tfs.npy", tfs)
+    np.save(tmp / "doc_len.npy", np.asarray(doc_len, dtype=np.int32))
+    (tmp / INDEX_VERSION_FILENAME).write_text(index_version, encoding="utf-8")
+    replace_dir(tmp, target)
+
+
+class SparseIndex:
+    def __init__(self, directory: Path) -> None:
+        path = sparse_dir(directory)
+        self.vocab: Dict[str, int] = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        self.term_offsets = load_npy(path / "term_offsets.npy", mmap_mode="r")
+        self.postings = load_npy(path / "postings.npy", mmap_mode="r")
+        self.tfs = load_npy(path / "tfs.npy", mmap_mode="r")
+        self.doc_len = load_npy(path / "doc_len.npy")
+        self.tokens = int(self.doc_len.sum())
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def _postings(self, term: str) -> Tuple[int, int]:
+        term_id = self.vocab[term]
+        return int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+
+    def corpus_stats(self, query: str) -> CorpusStats:
+        doc_freqs = {}
+        for term in set(tokenize(query)):
+            if term in self.vocab:
+                start, end = self._postings(term)
+                doc_freqs[term] = end - start
+        return CorpusStats(len(self.doc_len), self.tokens, doc_freqs)
+
+    def search(self, query: str, k: int, stats: Optional[CorpusStats] = None) -> List[Tuple[int, float]]:
+        # `stats` defaults to this index's own; pass merged ones to score shards alike
+        n = len(self.doc_len)
+        terms = {t for t in tokenize(query) if t in self.vocab}
+        if not n or not terms:
+            return []
+        stats = stats or self.corpus_stats(query)
+        avg_doc_len = max(stats.tokens / max(stats.rows, 1), 1e-9)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in terms:
+            start, end = self._postings(term)
+            rows = np.asarray(self.postings[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = stats.doc_freqs[term]
+            idf = math.log(1 + (stats.rows - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[rows] / avg_doc_len)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = min(k, int(np.count_nonzero(scores)))
+        if top == 0:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(row), float(scores[row])) for row in best]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,6 +1,20 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+import os
+import shutil
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+# np.load parses the .npy header with ast.literal_eval, which can fail with
+# "SystemError: AST constructor recursion depth mismatch" when several threads parse
+# at once on CPython 3.11 (gh-106905). Shards are opened from a thread pool.
+_NPY_LOAD_LOCK = threading.Lock()
 
 
 def is_exit(text: str) -> bool:
@@ -18,3 +32,25 @@ def format_sources(sources: Iterable[dict]) -> str:
     return "\n".join(formatted)
 
 
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def replace_dir(source: Path, target: Path) -> None:
+    # Swap a freshly written directory into place so readers never see a half-written one
+    old = target.with_name(target.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        os.replace(target, old)
+    os.replace(source, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def load_npy(path: Path, mmap_mode: Optional[str] = None) -> np.ndarray:
+    with _NPY_LOAD_LOCK:
+        return np.load(path, mmap_mode=mmap_mode)
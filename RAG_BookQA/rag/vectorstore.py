@@ -1,32 +1,397 @@
 from __future__ import annotations
 
+import os
+import random
+import shutil
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Callable, Deque, Iterable, List, Optional, Tuple
 
+import faiss
+import numpy as np
 from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
 
+from .chunkstore import MmapDocstore, PositionIds, chunk_store_exists, chunks_dir, write_chunk_store
 from .config import RAGSettings
+from .embedding_cache import CachedEmbeddings
 from .embeddings import create_embeddings
+from .metrics import stage
+from .quantization import (
+    RerankedIndex,
+    exact_index,
+    index_quantization,
+    index_vectors,
+    quantize_index,
+    vectors_path,
+    write_vectors,
+)
+from .sparse import (
+    sparse_dir,
+    sparse_index_exists,
+    sparse_index_version,
+    stamp_sparse_index,
+    write_sparse_index,
+)
+from .utils import batched, load_npy
 
 
-def build_faiss_index(settings: RAGSettings, documents: List[Document]) -> FAISS:
+INDEX_FILENAME = "index.faiss"
+LEGACY_DOCSTORE_FILENAME = "index.pkl"
+VERSION_FILENAME = "VERSION"
+RATE_LIMIT_MARKERS = (
+    "429",
+    "rate limit",
+    "ratelimit",
+    "quota",
+    "resource exhausted",
+    "resourceexhausted",
+    "503",
+    "unavailable",
+)
+MAX_BACKOFF_SECONDS = 60.0
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# FAISS k-means wants roughly this many training points per centroid
+TRAIN_POINTS_PER_CENTROID = 39
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    skipped: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def _embed_with_retry(
+    embeddings: Embeddings, texts: List[str], max_retries: int, stats: EmbeddingStats
+) -> List[List[float]]:
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            with stage("embed_documents"):
+                return embeddings.embed_documents(texts)
+        except Exception as e:  # noqa: BLE001
+            if attempt == max_retries or not _is_rate_limited(e):
+                raise
+            stats.retries += 1
+            # Exponential backoff with full jitter so concurrent workers do not retry in lockstep
+            time.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+    raise AssertionError("unreachable")
+
+
+def index_train_size(settings: RAGSettings) -> int:
+    if settings.index_type in ("ivf_flat", "ivf_pq"):
+        return TRAIN_POINTS_PER_CENTROID * settings.ivf_nlist
+    return 0
+
+
+def faiss_index_spec(settings: RAGSettings, dim: int, n_train: int) -> str:
+    index_type = settings.index_type
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{settings.hnsw_m},Flat"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    # Shrink the coarse quantizer when there is too little data to train it
+    nlist = max(1, min(settings.ivf_nlist, n_train // TRAIN_POINTS_PER_CENTROID))
+    if index_type == "ivf_pq" and n_train >= 2**settings.pq_nbits:
+        if dim % settings.pq_m:
+            raise ValueError(f"PQ_M={settings.pq_m} must divide the embedding dimension {dim}")
+        return f"IVF{nlist},PQ{settings.pq_m}x{settings.pq_nbits}"
+    return f"IVF{nlist},Flat"
+
+
+def index_kind(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def supports_removal(index) -> bool:
+    return not isinstance(index, faiss.IndexHNSW)
+
+
+def apply_search_params(settings: RAGSettings, index) -> None:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = settings.ivf_nprobe
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.hnsw_ef_search
+
+
+def new_faiss_index(settings: RAGSettings, train_vectors: np.ndarray):
+    dim = train_vectors.shape[1]
+    index = faiss.index_factory(dim, faiss_index_spec(settings, dim, len(train_vectors)))
+    if not index.is_trained:
+        index.train(train_vectors)
+    apply_search_params(settings, index)
+    return index
+
+
+def _add_embedded(
+    vector_store: FAISS, batch: List[Tuple[str, Document]], vectors: List[List[float]]
+) -> None:
+    ids = [chunk_id for chunk_id, _ in batch]
+    text_embeddings = [(doc.page_content, vector) for (_, doc), vector in zip(batch, vectors)]
+    metadatas = [doc.metadata for _, doc in batch]
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+
+def _create_store(
+    settings: RAGSettings,
+    embeddings: Embeddings,
+    embedded: List[Tuple[List[Tuple[str, Document]], List[List[float]]]],
+) -> FAISS:
+    train_vectors = np.array([v for _, vectors in embedded for v in vectors], dtype=np.float32)
+    index = new_faiss_index(settings, train_vectors)
+    vector_store = FAISS(embeddings, index, InMemoryDocstore(), {})
+    for batch, vectors in embedded:
+        _add_embedded(vector_store, batch, vectors)
+    return vector_store
+
+
+def embed_into_index(
+    settings: RAGSettings,
+    vector_store: Optional[FAISS],
+    chunks: Iterable[Tuple[str, Document]],
+    on_checkpoint: Optional[Callable[[FAISS], None]] = None,
+) -> Tuple[Optional[FAISS], EmbeddingStats]:
+    # Up to embed_concurrency batches are embedded at once; results are added in
+    # submission order from this thread because FAISS writes are not thread-safe.
+    # Chunk ids already in the index are skipped, so a crashed run resumes from
+    # its last checkpoint instead of starting over.
     embeddings = create_embeddings(settings)
-    vector_store = FAISS.from_documents(documents, embeddings)
+    stats = EmbeddingStats()
+    existing = set(vector_store.index_to_docstore_id.values()) if vector_store is not None else set()
+
+    def _pending_chunks() -> Iterable[Tuple[str, Document]]:
+        for chunk_id, doc in chunks:
+            if chunk_id in existing:
+                stats.skipped += 1
+                continue
+            yield chunk_id, doc
+
+    started = time.perf_counter()
+    in_flight: Deque[Tuple[List[Tuple[str, Document]], Future]] = deque()
+    # A new index is created only once enough vectors are buffered to train it (IVF)
+    untrained: List[Tuple[List[Tuple[str, Document]], List[List[float]]]] = []
+    train_size = index_train_size(settings)
+
+    def _drain_one() -> None:
+        nonlocal vector_store
+        batch, future = in_flight.popleft()
+        vectors = future.result()
+        stats.chunks += len(batch)
+        stats.batches += 1
+        if vector_store is None:
+            untrained.append((batch, vectors))
+            if sum(len(b) for b, _ in untrained) < train_size:
+                return
+            vector_store = _create_store(settings, embeddings, untrained)
+            untrained.clear()
+        else:
+            _add_embedded(vector_store, batch, vectors)
+        if on_checkpoint is not None and settings.checkpoint_every > 0:
+            if stats.batches % settings.checkpoint_every == 0:
+                on_checkpoint(vector_store)
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.embed_concurrency)) as pool:
+        for batch in batched(_pending_chunks(), settings.embed_batch_size):
+            texts = [doc.page_content for _, doc in batch]
+            future = pool.submit(_embed_with_retry, embeddings, texts, settings.embed_max_retries, stats)
+            in_flight.append((batch, future))
+            if len(in_flight) >= max(1, settings.embed_concurrency):
+                _drain_one()
+        while in_flight:
+            _drain_one()
+    if untrained:
+        vector_store = _create_store(settings, embeddings, untrained)
+
+    stats.seconds = time.perf_counter() - started
+    if isinstance(embeddings, CachedEmbeddings):
+        stats.cache_hits, stats.cache_misses = embeddings.hits, embeddings.misses
+    return vector_store, stats
+
+
+def build_faiss_index(
+    settings: RAGSettings, documents: List[Document], ids: Optional[List[str]] = None
+) -> FAISS:
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    vector_store, _ = embed_into_index(settings, None, zip(ids, documents))
+    if vector_store is None:
+        raise ValueError("Cannot build a FAISS index from an empty document list")
     return vector_store
 
 
-def save_faiss_index(vector_store: FAISS, directory: Path) -> None:
+def _renumber_ivf_labels(ivf) -> None:
+    # IVF removal keeps the labels of the remaining vectors, while FAISS.delete renumbers
+    # the docstore positions from 0 in label order. Give every vector the rank of its
+    # label, so labels are positions again and later adds do not reuse a taken label.
+    # The views point into the in-memory inverted lists and are updated in place.
+    lists = [
+        faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), ivf.invlists.list_size(list_no))
+        for list_no in range(ivf.nlist)
+        if ivf.invlists.list_size(list_no)
+    ]
+    if lists:
+        survivors = np.sort(np.concatenate(lists))
+        for labels in lists:
+            labels[:] = np.searchsorted(survivors, labels)
+
+
+def delete_documents(vector_store: FAISS, ids: Iterable[str]) -> int:
+    present = set(vector_store.index_to_docstore_id.values())
+    existing = [id_ for id_ in ids if id_ in present]
+    if existing:
+        vector_store.delete(existing)
+        ivf = faiss.try_extract_index_ivf(vector_store.index)
+        if ivf is not None:
+            _renumber_ivf_labels(ivf)
+    return len(existing)
+
+
+def index_exists(directory: Path) -> bool:
+    # Indexes saved in the old pickle format do not count; ingestion rebuilds them
+    return (directory / INDEX_FILENAME).exists() and chunk_store_exists(directory)
+
+
+def delete_faiss_index(directory: Path) -> None:
+    for name in (INDEX_FILENAME, LEGACY_DOCSTORE_FILENAME, VERSION_FILENAME):
+        (directory / name).unlink(missing_ok=True)
+    vectors_path(directory).unlink(missing_ok=True)
+    shutil.rmtree(chunks_dir(directory), ignore_errors=True)
+    shutil.rmtree(sparse_dir(directory), ignore_errors=True)
+
+
+def _write_index(index, directory: Path, quantization: str, version: str) -> None:
+    # `index` holds float32 vectors; with quantization the exact ones are written
+    # next to a quantized copy, for re-ranking and for the next ingestion
+    if quantization != "none" and index.ntotal:
+        vectors = index_vectors(index)
+        index = quantize_index(index, vectors, quantization)
+        write_vectors(directory, vectors)
+    else:
+        vectors_path(directory).unlink(missing_ok=True)
+    tmp_path = directory / (INDEX_FILENAME + ".tmp")
+    faiss.write_index(index, str(tmp_path))
+    os.replace(tmp_path, directory / INDEX_FILENAME)
+    (directory / VERSION_FILENAME).write_text(version, encoding="utf-8")
+
+
+def save_faiss_index(
+    vector_store: FAISS, directory: Path, with_sparse: bool = True, quantization: str = "none"
+) -> None:
     directory.mkdir(parents=True, exist_ok=True)
-    vector_store.save_local(str(directory))
+    positions = sorted(vector_store.index_to_docstore_id)
+    ids = [vector_store.index_to_docstore_id[i] for i in positions]
+    documents = [vector_store.docstore.search(id_) for id_ in ids]
+    write_chunk_store(directory, ids, documents)
+    # A fresh version on every save lets caches keyed on it drop stale entries. The
+    # BM25 index is stamped with it; one left from an earlier save (a checkpoint
+    # writes none) no longer matches and is not loaded.
+    version = uuid.uuid4().hex
+    if with_sparse:
+        write_sparse_index(directory, (doc.page_content for doc in documents), version)
+    (directory / LEGACY_DOCSTORE_FILENAME).unlink(missing_ok=True)
+    _write_index(vector_store.index, directory, quantization, version)
 
 
-def load_faiss_index(settings: RAGSettings) -> FAISS:
-    embeddings = create_embeddings(settings)
-    return FAISS.load_local(
-        str(settings.vectorstore_dir),
-        embeddings,
-        allow_dangerous_deserialization=True,
-    )
+def _read_exact_index(directory: Path):
+    # The saved index with float32 vectors, whether or not it was quantized
+    index = faiss.read_index(str(directory / INDEX_FILENAME))
+    if index_quantization(index) != "none":
+        index = exact_index(index, np.load(vectors_path(directory)))
+    return index
+
+
+def read_index_quantization(directory: Path) -> str:
+    return index_quantization(_read_index(directory / INDEX_FILENAME))
+
+
+def requantize_index(directory: Path, quantization: str) -> None:
+    # Re-encodes a saved index in place; chunk positions, the chunk store and the
+    # BM25 index are unchanged, so a current BM25 index stays current
+    version = uuid.uuid4().hex
+    if sparse_index_is_current(directory):
+        stamp_sparse_index(directory, version)
+    _write_index(_read_exact_index(directory), directory, quantization, version)
+
+
+def read_index_version(directory: Path) -> str:
+    path = directory / VERSION_FILENAME
+    return path.read_text(encoding="utf-8").strip() if path.exists() else ""
+
+
+def sparse_index_is_current(directory: Path) -> bool:
+    # Whether the BM25 index was written with the FAISS index saved last
+    version = read_index_version(directory)
+    return sparse_index_exists(directory) and bool(version) and sparse_index_version(directory) == version
+
+
+def _read_index(path: Path):
+    # Memory-mapped so workers share the vectors through the OS page cache. MMAP_IFC
+    # (faiss >= 1.11) maps flat codes in place; older builds fall back to plain MMAP.
+    for flag in (getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP):
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(str(path))
+
+
+def load_faiss_index(
+    settings: RAGSettings, writable: bool = False, embeddings: Optional[Embeddings] = None
+) -> FAISS:
+    # Pass `embeddings` to share one embedding client between several indexes
+    directory = settings.vectorstore_dir
+    if not index_exists(directory):
+        raise FileNotFoundError(f"No FAISS index in {directory}")
+    with stage("index_load"):
+        return _load_faiss_index(settings, directory, writable, embeddings or create_embeddings(settings))
 
 
+def _load_faiss_index(
+    settings: RAGSettings, directory: Path, writable: bool, embeddings: Embeddings
+) -> FAISS:
+    docstore = MmapDocstore(directory)
+    if writable:
+        # Ingestion mutates the index, so materialize everything in memory
+        index = _read_exact_index(directory)
+        apply_search_params(settings, index)
+        return FAISS(
+            embeddings,
+            index,
+            docstore.to_in_memory(),
+            {row: docstore.id_at(row) for row in range(len(docstore))},
+        )
+    index = _read_index(directory / INDEX_FILENAME)
+    apply_search_params(settings, index)
+    if settings.rerank_factor > 1 and vectors_path(directory).exists():
+        index = RerankedIndex(index, load_npy(vectors_path(directory), mmap_mode="r"), settings.rerank_factor)
+    return FAISS(embeddings, index, docstore, PositionIds(docstore))
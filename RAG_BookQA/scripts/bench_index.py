@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from rag.config import RAGSettings, load_settings
+from rag.quantization import QUANTIZATIONS, RerankedIndex, quantize_index
+from rag.vectorstore import INDEX_TYPES, apply_search_params, index_train_size, new_faiss_index
+
+
+def _synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    # Clustered data: uniform noise would make every ANN index look equally bad
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size=n)
+    return centers[assignments] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def _percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000.0)
+
+
+def build_index(settings: RAGSettings, corpus: np.ndarray):
+    index = new_faiss_index(settings, corpus[: index_train_size(settings) or len(corpus)])
+    index.add(corpus)
+    return index
+
+
+def bench_index(
+    settings: RAGSettings,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+    index=None,
+    index_build_seconds: float = 0.0,
+    quantization: str = "none",
+    rerank_factor: int = 0,
+) -> Dict[str, float]:
+    # Pass the float32 `index` (and the time it took to build) to reuse it for several quantizations
+    started = time.perf_counter()
+    if index is None:
+        index = build_index(settings, corpus)
+    if quantization != "none":
+        index = quantize_index(index, corpus, quantization)
+    build_seconds = index_build_seconds + time.perf_counter() - started
+    apply_search_params(settings, index)
+    # Memory held by the search index; re-ranking reads exact vectors from a memory map
+    size_mb = faiss.serialize_index(index).nbytes / 1e6
+    if rerank_factor > 1:
+        index = RerankedIndex(index, corpus, rerank_factor)
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - t0)
+        found[i] = ids[0]
+
+    # All queries in one call, as batch retrieval does
+    t0 = time.perf_counter()
+    index.search(queries, k)
+    batch_seconds = time.perf_counter() - t0
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    return {
+        "index_type": settings.index_type,
+        "quantization": quantization,
+        "rerank_factor": rerank_factor if rerank_factor > 1 else 0,
+        "recall_at_k": float(recall),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p99_ms": _percentile_ms(latencies, 99),
+        "batch_ms_per_query": batch_seconds * 1000.0 / len(queries),
+        "build_seconds": build_seconds,
+        "size_mb": size_mb,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare FAISS index types on synthetic vectors: recall@k vs flat, latency, size"
+    )
+    parser.add_argument("--n", type=int, default=100_000, help="Corpus vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=None, help="Defaults to RETRIEVAL_K")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument(
+        "--quantizations", nargs="+", default=list(QUANTIZATIONS), choices=QUANTIZATIONS,
+        help="Vector storage to compare for flat, ivf_flat and hnsw",
+    )
+    parser.add_argument(
+        "--rerank-factor", type=int, default=None, help="Defaults to RERANK_FACTOR; quantized runs are "
+        "reported with and without re-ranking"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    settings = load_settings()
+    k = args.k or settings.retrieval_k
+    corpus = _synthetic_vectors(args.n, args.dim, args.clusters, args.seed)
+    queries = _synthetic_vectors(args.queries, args.dim, args.clusters, args.seed + 1)
+
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(corpus)
+    _, truth = flat.search(queries, k)
+
+    rerank_factor = settings.rerank_factor if args.rerank_factor is None else args.rerank_factor
+    results = []
+    for index_type in args.types:
+        type_settings = replace(settings, index_type=index_type)
+        index: Optional[faiss.Index] = None
+        for quantization in args.quantizations:
+            if quantization != "none" and index_type == "ivf_pq":
+                continue
+            if index is None:
+                started = time.perf_counter()
+                index = build_index(type_settings, corpus)
+                seconds = time.perf_counter() - started
+            run = (type_settings, corpus, queries, truth, k, index, seconds, quantization)
+            results.append(bench_index(*run))
+            if quantization != "none" and rerank_factor > 1:
+                results.append(bench_index(*run, rerank_factor))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"n={args.n} dim={args.dim} queries={args.queries} k={k}")
+    print(
+        f"{'index':<10}{'vectors':>8}{'rerank':>8}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'batch ms':>10}{'build s':>10}{'size MB':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['index_type']:<10}{r['quantization']:>8}{r['rerank_factor'] or '-':>8}"
+            f"{r['recall_at_k']:>10.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+            f"{r['batch_ms_per_query']:>10.3f}{r['build_seconds']:>10.2f}{r['size_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
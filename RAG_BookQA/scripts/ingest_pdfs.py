@@ -1,23 +1,253 @@
 from __future__ import annotations
 
-from rag.config import load_settings
-from rag.loader import load_pdfs, split_documents
-from rag.vectorstore import build_faiss_index, save_faiss_index
+import argparse
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from langchain.docstore.document import Document
+
+from rag.config import RAGSettings, load_settings
+from rag.loader import iter_chunks, iter_pdf_pages, list_pdfs
+from rag.manifest import (
+    MANIFEST_FILENAME,
+    FileRecord,
+    IngestPlan,
+    chunk_id_prefix,
+    chunker_spec,
+    load_manifest,
+    make_chunk_id,
+    manifest_key,
+    plan_ingestion,
+    save_manifest,
+    stale_chunk_ids,
+)
+from rag.quantization import QUANTIZATIONS
+from rag.shards import (
+    SHARD_MODES,
+    ShardInfo,
+    book_collection,
+    catalog_exists,
+    catalog_shard_by,
+    delete_catalog,
+    load_catalog,
+    save_catalog,
+    shard_name,
+    shard_settings,
+    shards_dir,
+)
+from rag.vectorstore import (
+    EmbeddingStats,
+    delete_documents,
+    delete_faiss_index,
+    embed_into_index,
+    index_exists,
+    index_kind,
+    load_faiss_index,
+    read_index_quantization,
+    read_index_version,
+    save_faiss_index,
+    sparse_index_is_current,
+    supports_removal,
+)
+
+
+def _iter_new_chunks(
+    settings: RAGSettings, plan: IngestPlan, manifest: Dict[str, FileRecord]
+) -> Iterator[Tuple[str, Document]]:
+    for pdf_path, pages in iter_pdf_pages(plan.to_embed, settings.load_workers):
+        key = manifest_key(settings, pdf_path)
+        sha256 = plan.hashes[key]
+        prefix = chunk_id_prefix(settings, sha256)
+        chunk_ids = []
+        for chunk in iter_chunks(settings, pages):
+            chunk_id = make_chunk_id(prefix, len(chunk_ids))
+            chunk_ids.append(chunk_id)
+            yield chunk_id, chunk
+        manifest[key] = FileRecord(
+            sha256=sha256,
+            chunk_size=settings.chunk_size,
+            chunk_overlap=settings.chunk_overlap,
+            embedding_model=settings.embedding_model_name,
+            chunk_ids=chunk_ids,
+            chunker=chunker_spec(settings),
+        )
+        print(f"  + {key}: {len(chunk_ids)} chunks")
+
+
+def ingest_index(
+    settings: RAGSettings, pdf_paths: List[Path], rebuild: bool
+) -> Tuple[IngestPlan, EmbeddingStats, int]:
+    # Brings the index in settings.vectorstore_dir in line with pdf_paths
+    manifest = {}
+    vs = None
+    quantization = None
+    if not rebuild and index_exists(settings.vectorstore_dir):
+        # Loaded even without a manifest: a checkpoint from an interrupted first run resumes here
+        manifest = load_manifest(settings.vectorstore_dir)
+        quantization = read_index_quantization(settings.vectorstore_dir)
+        vs = load_faiss_index(settings, writable=True)
+        if index_kind(vs.index) != settings.index_type:
+            print(f"INDEX_TYPE changed to {settings.index_type}; rebuilding the index.")
+            manifest, vs = {}, None
+
+    plan = plan_ingestion(settings, manifest, pdf_paths)
+
+    deleted = 0
+    if vs is not None:
+        stale = stale_chunk_ids(settings, plan, manifest, vs.index_to_docstore_id.values())
+        if stale and not supports_removal(vs.index):
+            # HNSW graphs cannot drop vectors; start over (the embedding cache keeps this cheap)
+            print(f"{settings.index_type} indexes do not support deletion; rebuilding the index.")
+            deleted = len(stale)
+            manifest, vs = {}, None
+            plan = plan_ingestion(settings, manifest, pdf_paths)
+        else:
+            deleted = delete_documents(vs, stale)
+    for key in plan.removed:
+        manifest.pop(key, None)
+
+    def _checkpoint(store) -> None:
+        # The BM25 index and the quantized copy are built once at the end, not at every
+        # checkpoint; the new VERSION marks the BM25 index of the last full save stale
+        save_faiss_index(store, settings.vectorstore_dir, with_sparse=False)
+
+    vs, stats = embed_into_index(
+        settings, vs, _iter_new_chunks(settings, plan, manifest), on_checkpoint=_checkpoint
+    )
+
+    stale_sparse = not sparse_index_is_current(settings.vectorstore_dir)
+    if vs is not None and (
+        stats.chunks or deleted or stale_sparse or quantization != settings.vector_quantization
+    ):
+        save_faiss_index(vs, settings.vectorstore_dir, quantization=settings.vector_quantization)
+    elif vs is None and deleted:
+        delete_faiss_index(settings.vectorstore_dir)
+    save_manifest(settings.vectorstore_dir, manifest)
+    return plan, stats, deleted
+
+
+def _shard_is_current(settings: RAGSettings, info: Optional[ShardInfo], pdf_paths: List[Path]) -> bool:
+    # Skips opening the index of a shard none of whose books changed
+    if info is None or info.index_type != settings.index_type or not index_exists(settings.vectorstore_dir):
+        return False
+    if info.quantization != settings.vector_quantization:
+        return False
+    if not sparse_index_is_current(settings.vectorstore_dir):
+        return False
+    plan = plan_ingestion(settings, load_manifest(settings.vectorstore_dir), pdf_paths)
+    return not plan.to_embed and not plan.removed
+
+
+def ingest_shards(
+    settings: RAGSettings, pdf_paths: List[Path], rebuild: bool
+) -> Tuple[IngestPlan, EmbeddingStats, int]:
+    directory = settings.vectorstore_dir
+    if catalog_exists(directory) and catalog_shard_by(directory) != settings.shard_by:
+        print(f"SHARD_BY changed to {settings.shard_by}; rebuilding all shards.")
+        delete_catalog(directory)
+    catalog = load_catalog(directory)
+
+    groups: Dict[str, List[Path]] = {}
+    for pdf_path in pdf_paths:
+        groups.setdefault(shard_name(settings, pdf_path), []).append(pdf_path)
+
+    total_plan, total_stats, total_deleted = IngestPlan(), EmbeddingStats(), 0
+    # Shards whose books are all gone (and leftovers of interrupted runs)
+    if shards_dir(directory).exists():
+        for path in sorted(shards_dir(directory).iterdir()):
+            if path.is_dir() and path.name not in groups:
+                total_plan.removed.extend(load_manifest(path))
+                shutil.rmtree(path)
+                catalog.pop(path.name, None)
+                print(f"  - shard {path.name}")
+    for name in set(catalog) - set(groups):
+        catalog.pop(name)
+
+    for name, paths in sorted(groups.items()):
+        shard = shard_settings(settings, name)
+        if not rebuild and _shard_is_current(shard, catalog.get(name), paths):
+            total_plan.unchanged.extend(paths)
+            continue
+        print(f"Shard {name}:")
+        plan, stats, deleted = ingest_index(shard, paths, rebuild)
+        for key in ("new", "changed", "unchanged", "removed"):
+            getattr(total_plan, key).extend(getattr(plan, key))
+        for key in ("chunks", "skipped", "batches", "retries", "seconds", "cache_hits", "cache_misses"):
+            setattr(total_stats, key, getattr(total_stats, key) + getattr(stats, key))
+        total_deleted += deleted
+
+        if index_exists(shard.vectorstore_dir):
+            manifest = load_manifest(shard.vectorstore_dir)
+            catalog[name] = ShardInfo(
+                collection=book_collection(settings, paths[0]),
+                books=sorted(manifest),
+                chunks=sum(len(record.chunk_ids) for record in manifest.values()),
+                version=read_index_version(shard.vectorstore_dir),
+                index_type=settings.index_type,
+                quantization=settings.vector_quantization,
+            )
+        else:
+            # Nothing to index (e.g. a PDF without extractable text)
+            shutil.rmtree(shard.vectorstore_dir, ignore_errors=True)
+            catalog.pop(name, None)
+        # Saved after every shard so an interrupted run keeps the finished ones
+        save_catalog(directory, settings.shard_by, catalog)
+    save_catalog(directory, settings.shard_by, catalog)
+
+    if index_exists(directory):
+        # The catalog replaces the single index from before sharding
+        print(f"Removing the unsharded index in {directory}.")
+        delete_faiss_index(directory)
+        (directory / MANIFEST_FILENAME).unlink(missing_ok=True)
+    return total_plan, total_stats, total_deleted
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build or update the FAISS index from data/pdfs")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Ignore the manifest and re-embed every PDF"
+    )
+    args = parser.parse_args(argv)
 
-def main() -> None:
     settings = load_settings()
-    docs = load_pdfs(settings)
-    if not docs:
+    if settings.shard_by not in SHARD_MODES:
+        parser.error(f"SHARD_BY must be one of {', '.join(SHARD_MODES)}")
+    if settings.vector_quantization not in QUANTIZATIONS:
+        parser.error(f"VECTOR_QUANTIZATION must be one of {', '.join(QUANTIZATIONS)}")
+    if settings.vector_quantization != "none" and settings.index_type == "ivf_pq":
+        parser.error("ivf_pq indexes are already compressed; use VECTOR_QUANTIZATION=none")
+    pdf_paths = list_pdfs(settings)
+    directory = settings.vectorstore_dir
+
+    if not pdf_paths and not load_manifest(directory) and not catalog_exists(directory):
         print(f"No PDFs found in {settings.pdf_dir}. Please add files and retry.")
         return
-    chunks = split_documents(settings, docs)
-    vs = build_faiss_index(settings, chunks)
-    save_faiss_index(vs, settings.vectorstore_dir)
-    print(f"FAISS index saved to {settings.vectorstore_dir}")
 
+    if settings.shard_by == "none":
+        if catalog_exists(directory):
+            print("SHARD_BY=none; removing the shards.")
+            delete_catalog(directory)
+        plan, stats, deleted = ingest_index(settings, pdf_paths, args.rebuild)
+    else:
+        plan, stats, deleted = ingest_shards(settings, pdf_paths, args.rebuild)
 
-if __name__ == "__main__":
-    main()
+    print(
+        f"Added {len(plan.new)} new and {len(plan.changed)} changed file(s) "
+        f"({stats.chunks} chunks embedded, {stats.skipped} resumed from checkpoint), "
+        f"skipped {len(plan.unchanged)} unchanged, "
+        f"removed {len(plan.removed)} ({deleted} stale chunks deleted)."
+    )
+    print(
+        f"Embedding: {stats.batches} batches, {stats.retries} rate-limit retries, "
+        f"{stats.cache_hits} cache hits / {stats.cache_misses} remote, "
+        f"{stats.chunks_per_sec:.1f} chunks/sec"
+    )
+    if settings.shard_by == "none":
+        print(f"FAISS index saved to {directory}")
+    else:
+        print(f"{len(load_catalog(directory))} {settings.shard_by} shard(s) in {shards_dir(directory)}")
 
 
+if __name__ == "__main__":
+    main()
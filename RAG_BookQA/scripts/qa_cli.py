@@ -1,15 +1,108 @@
 from __future__ import annotations
 
-from rag.chain import ask_question, build_conversational_chain
-from rag.config import load_settings
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+from langchain.chains import ConversationalRetrievalChain
+
+from rag.chain import (
+    SUMMARY_TAG,
+    aanswer_batch,
+    ask_question,
+    build_conversational_chain,
+    normalize_language,
+    scoped_chain,
+    select_history,
+)
+from rag.config import RAGSettings, load_settings
+from rag.llm import create_llm
+from rag.memory import ConversationHistory, summarize_evicted
 from rag.utils import format_sources, is_exit
-from rag.vectorstore import load_faiss_index
+from rag.shards import load_retriever
+
+
+def _read_questions(path: Path) -> List[Dict[str, Any]]:
+    # One JSON object per line with "question" and optional "id" and "language";
+    # a bare JSON string is accepted as the question
+    records = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            records.append({"question": record} if isinstance(record, str) else record)
+    return records
+
+
+async def _run_batch(
+    settings: RAGSettings, chain: ConversationalRetrievalChain, records: List[Dict[str, Any]], out: TextIO
+) -> int:
+    items = [(r["question"], normalize_language(r.get("language"))) for r in records]
+    errors = 0
+    async for i, answer, sources, error, _ in aanswer_batch(chain, items, settings.batch_concurrency):
+        record = records[i]
+        result: Dict[str, Any] = {
+            "id": record.get("id", i),
+            "question": record["question"],
+            "answer": answer,
+            "sources": sources,
+        }
+        if error is not None:
+            result["error"] = error
+            errors += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+    return errors
 
 
-def main() -> None:
+def run_batch(
+    settings: RAGSettings, chain: ConversationalRetrievalChain, questions_path: Path, output: Optional[Path]
+) -> None:
+    records = _read_questions(questions_path)
+    started = time.perf_counter()
+    out = output.open("w", encoding="utf-8") if output is not None else sys.stdout
+    try:
+        errors = asyncio.run(_run_batch(settings, chain, records, out))
+    finally:
+        if output is not None:
+            out.close()
+    seconds = time.perf_counter() - started
+    print(
+        f"Answered {len(records)} questions in {seconds:.1f}s"
+        f" ({len(records) / seconds if seconds else 0.0:.2f}/s, {errors} errors)",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Ask questions about the indexed books")
+    parser.add_argument(
+        "--batch", type=Path, help="Answer the questions in a JSONL file instead of chatting"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="Write batch results (JSONL) here instead of stdout"
+    )
+    parser.add_argument("--book", help="Search only this book (needs a sharded index)")
+    parser.add_argument("--collection", help="Search only this collection (needs a sharded index)")
+    args = parser.parse_args(argv)
+
     settings = load_settings()
-    vs = load_faiss_index(settings)
-    chain = build_conversational_chain(settings, vs)
+    chain = build_conversational_chain(settings, retriever=load_retriever(settings))
+    try:
+        chain = scoped_chain(chain, args.book, args.collection)
+    except (ValueError, LookupError) as e:
+        parser.error(str(e))
+    if args.batch is not None:
+        run_batch(settings, chain, args.batch, args.output)
+        return
+
+    history = ConversationHistory(settings.history_token_budget)
+    summary_llm = create_llm(settings, tags=[SUMMARY_TAG]) if settings.history_summary else None
     print("RAG CLI ready. Ask questions in English or Bangla. Type 'exit' to quit.")
     while True:
         try:
@@ -22,13 +115,17 @@ def main() -> None:
         if is_exit(question):
             print("Goodbye!")
             break
-        answer, sources = ask_question(chain, question)
+        chat_history, _ = select_history(question, history.messages(), settings.condense_mode)
+        answer, sources = ask_question(chain, question, chat_history)
         print(f"\nAssistant: {answer}\n")
         if sources:
             print("Sources:\n" + format_sources(sources) + "\n")
+        history.add_turn(question, answer)
+        if summary_llm is not None:
+            summarize_evicted(summary_llm, history)
+        else:
+            history.take_evicted()
 
 
 if __name__ == "__main__":
     main()
-
-
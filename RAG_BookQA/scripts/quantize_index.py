@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+from rag.config import load_settings
+from rag.quantization import QUANTIZATIONS, vectors_path
+from rag.shards import catalog_exists, catalog_shard_by, load_catalog, save_catalog, shard_settings
+from rag.vectorstore import (
+    INDEX_FILENAME,
+    index_exists,
+    read_index_quantization,
+    read_index_version,
+    requantize_index,
+)
+
+
+def _sizes_mb(directory: Path) -> Tuple[float, float]:
+    # (search index, exact vectors on disk): only the first has to stay in memory
+    vectors = vectors_path(directory)
+    return (
+        (directory / INDEX_FILENAME).stat().st_size / 1e6,
+        vectors.stat().st_size / 1e6 if vectors.exists() else 0.0,
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert the saved index (or every shard) to another vector quantization in place"
+    )
+    parser.add_argument(
+        "--to", choices=QUANTIZATIONS, help="Target quantization; defaults to VECTOR_QUANTIZATION"
+    )
+    args = parser.parse_args(argv)
+
+    settings = load_settings()
+    target = args.to or settings.vector_quantization
+    if target not in QUANTIZATIONS:
+        parser.error(f"VECTOR_QUANTIZATION must be one of {', '.join(QUANTIZATIONS)}")
+    directory = settings.vectorstore_dir
+
+    sharded = catalog_exists(directory)
+    catalog = load_catalog(directory) if sharded else {}
+    targets: List[Tuple[str, Path]] = (
+        [(name, shard_settings(settings, name).vectorstore_dir) for name in sorted(catalog)]
+        if sharded
+        else [(directory.name, directory)]
+    )
+    if not any(index_exists(path) for _, path in targets):
+        print(f"No index in {directory}. Run `python -m scripts.ingest_pdfs` first.")
+        return
+
+    before_total, after_total = 0.0, 0.0
+    for name, path in targets:
+        if not index_exists(path):
+            continue
+        current = read_index_quantization(path)
+        before, _ = _sizes_mb(path)
+        if current == target:
+            print(f"  {name}: already {target}")
+            before_total, after_total = before_total + before, after_total + before
+            continue
+        started = time.perf_counter()
+        try:
+            requantize_index(path, target)
+        except ValueError as e:
+            parser.error(str(e))
+        after, vectors = _sizes_mb(path)
+        before_total, after_total = before_total + before, after_total + after
+        exact = f" (+{vectors:.1f} MB exact vectors, memory-mapped)" if vectors else ""
+        print(
+            f"  {name}: {current} -> {target}, index {before:.1f} MB -> {after:.1f} MB{exact},"
+            f" {time.perf_counter() - started:.2f}s"
+        )
+        if sharded:
+            catalog[name].version = read_index_version(path)
+            catalog[name].quantization = target
+    if sharded:
+        save_catalog(directory, catalog_shard_by(directory), catalog)
+    print(f"Index memory: {before_total:.1f} MB -> {after_total:.1f} MB.")
+    if target != settings.vector_quantization:
+        # Otherwise the next ingestion converts the index back
+        print(f"Set VECTOR_QUANTIZATION={target} to keep it.")
+
+
+if __name__ == "__main__":
+    main()
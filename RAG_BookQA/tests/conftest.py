@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# Tests import rag, app and scripts the way `python -m scripts.ingest_pdfs` does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
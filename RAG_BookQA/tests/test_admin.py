@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import pytest
+
+from benchmarks.corpus import generate_corpus
+
+
+TOKEN = "s3cret-admin-token"
+ADMIN_ENDPOINTS = ["/admin/reload?force=true", "/shards/book_000/load", "/shards/book_000/unload"]
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # A sharded offline index, so the shard endpoints have a shard to load
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in {
+            "DATA_DIR": str(tmp_path_factory.mktemp("data")),
+            "EMBEDDING_PROVIDER": "fake",
+            "LLM_PROVIDER": "fake",
+            "SHARD_BY": "book",
+            "INDEX_WATCH_INTERVAL": "0",
+            "ADMIN_TOKEN": TOKEN,
+        }.items():
+            monkeypatch.setenv(name, value)
+        from rag.config import load_settings
+        from scripts.ingest_pdfs import main as ingest
+
+        generate_corpus(load_settings().pdf_dir, books=2, pages_per_book=2)
+        ingest([])
+        from app.main import app
+
+        yield app
+
+
+def _post_all(
+    app, paths: List[str], token: Optional[str], admin_token: Optional[str] = None
+) -> List[Tuple[int, Dict[str, Any]]]:
+    import app.main as main
+
+    async def run() -> List[Tuple[int, Dict[str, Any]]]:
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            if admin_token is not None:
+                main.settings = replace(main.settings, admin_token=admin_token)
+            headers = {"X-Admin-Token": token} if token is not None else {}
+            responses = [await client.post(path, headers=headers) for path in paths]
+            return [(response.status_code, response.json()) for response in responses]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("token", [None, "", "wrong-token"])
+def test_admin_endpoints_reject_a_missing_or_wrong_token(app, token):
+    for status, body in _post_all(app, ADMIN_ENDPOINTS, token):
+        assert status == 403
+        assert body["detail"] == "Invalid admin token"
+
+
+@pytest.mark.parametrize("token", [None, "", TOKEN])
+def test_admin_endpoints_are_refused_when_no_token_is_configured(app, token):
+    for status, body in _post_all(app, ADMIN_ENDPOINTS, token, admin_token=""):
+        assert status == 403
+        assert "ADMIN_TOKEN" in body["detail"]
+
+
+def test_admin_endpoints_accept_the_configured_token(app):
+    (reload, _), (load, loaded), (unload, unloaded) = _post_all(app, ADMIN_ENDPOINTS, TOKEN)
+    assert (reload, load, unload) == (200, 200, 200)
+    assert loaded == {"loaded": True}
+    assert unloaded == {"unloaded": True}
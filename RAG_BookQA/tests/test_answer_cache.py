@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import numpy as np
+
+from rag import answer_cache
+from rag.answer_cache import SemanticAnswerCache
+
+
+def _vector(seed: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+
+
+def test_lookup_matches_language_version_and_threshold():
+    cache = SemanticAnswerCache(max_entries=10, ttl_seconds=0, threshold=0.95)
+    question = _vector(0)
+    cache.store(question, "en", "v1", "an answer", [{"page": 1}])
+
+    hit = cache.lookup(question * 3 + 0.01, "en", "v1")
+    assert hit is not None and hit.answer == "an answer" and hit.similarity > 0.99
+    assert cache.lookup(question, "bn", "v1") is None
+    assert cache.lookup(question, "en", "v2") is None
+    assert cache.lookup(_vector(1), "en", "v1") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_stores_write_rows_in_place_and_eviction_reuses_rows():
+    cache = SemanticAnswerCache(max_entries=100, ttl_seconds=0, threshold=0.99)
+    for i in range(64):
+        cache.store(_vector(i), "en", "v1", f"answer {i}", [])
+    for i in range(64, 100):
+        cache.store(_vector(i), "en", "v1", f"answer {i}", [])
+    # The matrix doubled once up to max_entries, then was written in place
+    assert len(cache._matrix) == 100
+    matrix = cache._matrix
+
+    # Touch entry 0, so entry 1 is the least recently used one
+    assert cache.lookup(_vector(0), "en", "v1").answer == "answer 0"
+    cache.store(_vector(100), "en", "v1", "answer 100", [])
+    assert cache._matrix is matrix
+    assert cache.stats()["entries"] == 100
+    assert cache.lookup(_vector(1), "en", "v1") is None
+    for i in (0, 2, 99, 100):
+        assert cache.lookup(_vector(i), "en", "v1").answer == f"answer {i}"
+
+
+def test_expired_entries_free_their_rows(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(max_entries=10, ttl_seconds=60, threshold=0.99)
+    cache.store(_vector(0), "en", "v1", "old", [])
+    now[0] += 30
+    cache.store(_vector(1), "en", "v1", "new", [])
+    now[0] += 45
+
+    assert cache.lookup(_vector(0), "en", "v1") is None
+    assert cache.lookup(_vector(1), "en", "v1").answer == "new"
+    cache.store(_vector(2), "en", "v1", "reused", [])
+    assert cache._high == 2
+    assert cache.lookup(_vector(2), "en", "v1").answer == "reused"
+
+
+def test_clear_and_a_new_embedding_size_start_over():
+    cache = SemanticAnswerCache(max_entries=10, ttl_seconds=0, threshold=0.99)
+    cache.store(_vector(0), "en", "v1", "answer", [])
+    cache.clear()
+    assert cache.lookup(_vector(0), "en", "v1") is None
+
+    cache.store(_vector(0), "en", "v1", "answer", [])
+    cache.store(_vector(1, dim=4), "en", "v1", "smaller model", [])
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup(_vector(0), "en", "v1") is None
+    assert cache.lookup(_vector(1, dim=4), "en", "v1").answer == "smaller model"
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+
+from benchmarks.corpus import generate_corpus
+
+
+QUESTIONS = [
+    "What happens to the river near the village?",
+    "Why does the poet remember the storm?",
+    "Who waits at the station?",
+    "When does the monsoon arrive?",
+]
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # A retriever cache smaller than the batch, so its entries are evicted mid-batch
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in {
+            "DATA_DIR": str(tmp_path_factory.mktemp("data")),
+            "EMBEDDING_PROVIDER": "fake",
+            "LLM_PROVIDER": "fake",
+            "SHARD_BY": "none",
+            "INDEX_WATCH_INTERVAL": "0",
+            "RETRIEVER_CACHE_SIZE": "1",
+        }.items():
+            monkeypatch.setenv(name, value)
+        from rag.config import load_settings
+        from scripts.ingest_pdfs import main as ingest
+
+        generate_corpus(load_settings().pdf_dir, books=2, pages_per_book=3)
+        ingest([])
+        from app.main import app
+
+        yield app
+
+
+def _ask_batch_then_ask(app) -> Tuple[List[Dict[str, Any]], Dict[str, float], List[Dict[str, Any]]]:
+    import app.main as main
+
+    async def run():
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            batch = await client.post("/ask_batch", json={"questions": [{"question": q} for q in QUESTIONS]})
+            records = [json.loads(line) for line in batch.text.splitlines()]
+            embedding_stats = main.chain.retriever.embeddings.stats()
+            answers = [(await client.post("/ask", json={"question": q})).json() for q in QUESTIONS]
+            return records, embedding_stats, answers
+
+    return asyncio.run(run())
+
+
+def test_batch_prewarms_the_answer_cache_with_the_embeddings_it_computed(app):
+    records, embedding_stats, answers = _ask_batch_then_ask(app)
+
+    assert sorted(record["id"] for record in records) == list(range(len(QUESTIONS)))
+    assert all("error" not in record for record in records)
+    # One batched embedding per question, none again to store the answers
+    assert embedding_stats["hits"] + embedding_stats["misses"] == len(QUESTIONS)
+    by_question = {record["question"]: record for record in records}
+    for question, answer in zip(QUESTIONS, answers):
+        assert answer["cached"] is True
+        assert answer["answer"] == by_question[question]["answer"]
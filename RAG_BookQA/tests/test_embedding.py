@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+from rag import vectorstore
+from rag.config import load_settings
+from rag.embedding_cache import CachedEmbeddings, text_hash
+
+
+DIM = 16
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    # Fake backend that records every call and fails the first `failures` of them
+    # with a rate-limit error
+    calls: List[List[str]] = []
+    failures: int = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("429 Resource exhausted")
+        return super().embed_documents(texts)
+
+
+def _cached(path: Path, underlying=None) -> CachedEmbeddings:
+    return CachedEmbeddings(underlying or DeterministicFakeEmbedding(size=DIM), path, "fake:test", max_entries=1000)
+
+
+def _embed_in_new_process(path: str, texts: List[str]) -> Tuple[int, int, List[List[float]]]:
+    embeddings = _cached(Path(path))
+    vectors = embeddings.embed_documents(texts)
+    embeddings.close()
+    return embeddings.hits, embeddings.misses, vectors
+
+
+def _run_in_new_process(path: Path, texts: List[str]) -> Tuple[int, int, List[List[float]]]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_embed_in_new_process, str(path), texts).result()
+
+
+def test_cache_counts_hits_and_misses_and_calls_backend_once_per_new_text(tmp_path):
+    backend = CountingEmbeddings(size=DIM, calls=[])
+    embeddings = _cached(tmp_path / "cache.sqlite3", backend)
+
+    first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+    # A batch that mixes hits and misses
+    second = embeddings.embed_documents(["beta", "  beta ", "gamma"])
+
+    assert backend.calls == [["alpha", "beta"], ["gamma"]]
+    assert (embeddings.hits, embeddings.misses) == (3, 3)
+    assert first[0] == first[2] and second[0] == second[1] == first[1]
+    # Query vectors are cached apart from document vectors
+    embeddings.embed_query("alpha")
+    assert embeddings.misses == 4
+
+
+def test_cache_size_counts_only_new_keys(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    vector = _cached(path).embed_documents(["alpha", "beta"])[1]
+    # A second worker missed "beta" before the first one stored it
+    embeddings = _cached(path)
+    embeddings._store("document", {text_hash("beta"): vector, text_hash("gamma"): vector})
+
+    assert embeddings.stats()["entries"] == 3
+    assert _cached(path).stats()["entries"] == 3
+
+
+def test_cache_is_shared_across_processes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    texts = ["Pather Panchali", "Apu and Durga", "the monsoon"]
+
+    hits, misses, vectors = _run_in_new_process(path, texts)
+    assert (hits, misses) == (0, 3)
+
+    hits, misses, again = _run_in_new_process(path, texts + ["a new page"])
+    assert (hits, misses) == (3, 1)
+    assert again[:3] == vectors
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return replace(
+        load_settings(),
+        data_dir=tmp_path,
+        vectorstore_dir=tmp_path / "vectorstore",
+        embedding_provider="fake",
+        embed_batch_size=4,
+        embed_concurrency=3,
+        embed_max_retries=3,
+    )
+
+
+def test_embedding_stage_retries_rate_limits_and_keeps_chunk_order(settings, monkeypatch):
+    backend = CountingEmbeddings(size=DIM, calls=[], failures=2)
+    monkeypatch.setattr(vectorstore, "create_embeddings", lambda _: backend)
+    monkeypatch.setattr(vectorstore.time, "sleep", lambda _: None)
+    chunks = [(f"chunk-{i:02d}", Document(page_content=f"page text {i}")) for i in range(10)]
+
+    store, stats = vectorstore.embed_into_index(settings, None, chunks)
+
+    assert (stats.chunks, stats.batches, stats.retries) == (10, 3, 2)
+    assert [store.index_to_docstore_id[i] for i in range(10)] == [chunk_id for chunk_id, _ in chunks]
+    expected = DeterministicFakeEmbedding(size=DIM).embed_documents([doc.page_content for _, doc in chunks])
+    assert np.allclose(store.index.reconstruct_n(0, 10), expected, atol=1e-6)
+
+
+def test_embedding_stage_skips_chunks_already_in_the_index(settings, monkeypatch):
+    backend = CountingEmbeddings(size=DIM, calls=[])
+    monkeypatch.setattr(vectorstore, "create_embeddings", lambda _: backend)
+    chunks = [(f"chunk-{i}", Document(page_content=f"page text {i}")) for i in range(6)]
+
+    store, _ = vectorstore.embed_into_index(settings, None, chunks[:4])
+    backend.calls.clear()
+    store, stats = vectorstore.embed_into_index(settings, store, chunks)
+
+    assert (stats.chunks, stats.skipped) == (2, 4)
+    assert backend.calls == [["page text 4", "page text 5"]]
+    assert store.index.ntotal == 6
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+
+from rag import metrics
+from rag.config import load_settings
+from rag.llm import create_llm
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("LLM_PROVIDER", "fake")
+    yield replace(load_settings(), metrics_enabled=True, fake_llm_latency=0.0)
+    metrics.configure(False)
+
+
+def test_llm_calls_are_timed_only_when_metrics_are_switched_on(settings):
+    # METRICS_ENABLED alone does not attach the timer: only the API calls configure()
+    metrics.configure(False)
+    assert not create_llm(settings).callbacks
+
+    metrics.configure(True)
+    llm = create_llm(settings, tags=["rag_answer"])
+    assert llm.callbacks == [metrics.LLM_TIMER]
+    before = metrics.render()
+    llm.invoke("Who is Apu?")
+    assert metrics.render() != before
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from rag.chain import _format_sources
+
+
+@pytest.fixture(scope="module", params=["none", "book"])
+def settings(request, tmp_path_factory):
+    # An offline index, unsharded and sharded per book
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in {
+            "DATA_DIR": str(tmp_path_factory.mktemp("data")),
+            "EMBEDDING_PROVIDER": "fake",
+            "SHARD_BY": request.param,
+            "CONTEXT_TOKEN_BUDGET": "0",
+        }.items():
+            monkeypatch.setenv(name, value)
+        from rag.config import load_settings
+        from scripts.ingest_pdfs import main as ingest
+
+        settings = load_settings()
+        generate_corpus(settings.pdf_dir, books=2, pages_per_book=3)
+        ingest([])
+        yield settings
+
+
+@pytest.mark.parametrize(
+    "mode, score_kind, descending", [("dense", "l2", False), ("hybrid", "rrf", True)]
+)
+def test_sources_name_the_scale_of_their_score(settings, mode, score_kind, descending):
+    from rag.shards import load_retriever
+
+    retriever = load_retriever(replace(settings, retrieval_mode=mode))
+    sources = _format_sources(retriever.invoke("What happens to the river near the village?"))
+
+    assert len(sources) == settings.retrieval_k
+    assert {source["score_kind"] for source in sources} == {score_kind}
+    scores = [source["score"] for source in sources]
+    assert scores == sorted(scores, reverse=descending)
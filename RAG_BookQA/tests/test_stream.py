@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import pytest
+
+from benchmarks.corpus import generate_corpus
+
+
+def _parse_sse(body: str) -> List[Tuple[str, Dict[str, Any]]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    # A small offline index, with the fake embedding and streaming chat models
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        data_dir = tmp_path_factory.mktemp("data")
+        for name, value in {
+            "DATA_DIR": str(data_dir),
+            "EMBEDDING_PROVIDER": "fake",
+            "LLM_PROVIDER": "fake",
+            "SHARD_BY": "none",
+            "INDEX_WATCH_INTERVAL": "0",
+            "ADMIN_TOKEN": "",
+        }.items():
+            monkeypatch.setenv(name, value)
+        from rag.config import load_settings
+        from scripts.ingest_pdfs import main as ingest
+
+        generate_corpus(load_settings().pdf_dir, books=2, pages_per_book=3)
+        ingest([])
+        from app.main import app
+
+        yield app
+
+
+def _post_all(app, requests: List[Tuple[str, Dict[str, Any]]]) -> List[httpx.Response]:
+    async def run() -> List[httpx.Response]:
+        async with app.router.lifespan_context(app), httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            return [await client.post(path, json=body) for path, body in requests]
+
+    return asyncio.run(run())
+
+
+def test_stream_sends_tokens_in_order_then_sources_then_done(app):
+    question = {"question": "What happens to the river near the village?", "use_cache": False}
+    streamed, answered = _post_all(app, [("/ask/stream", question), ("/ask", question)])
+
+    assert streamed.status_code == 200
+    assert streamed.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(streamed.text)
+    kinds = [kind for kind, _ in events]
+    tokens = [data["text"] for kind, data in events if kind == "token"]
+
+    # Every token comes first, then exactly one sources event, and done is last
+    assert kinds == ["token"] * len(tokens) + ["sources", "done"]
+    assert len(tokens) > 1
+    # The fake model streams its answer word by word, so the tokens in arrival
+    # order rebuild the answer /ask returns for the same question
+    assert "".join(tokens) == answered.json()["answer"]
+    sources = events[-2][1]
+    assert sources["cached"] is False
+    assert sources["sources"] == answered.json()["sources"]
+    assert sources["sources"] and all("source" in source for source in sources["sources"])
+
+
+def test_stream_replays_a_cached_answer_as_one_token(app):
+    question = {"question": "Why does the poet remember the storm?"}
+    first, second = _post_all(app, [("/ask/stream", question), ("/ask/stream", question)])
+
+    answer = "".join(data["text"] for kind, data in _parse_sse(first.text) if kind == "token")
+    events = _parse_sse(second.text)
+    assert [kind for kind, _ in events] == ["token", "sources", "done"]
+    assert events[0][1]["text"] == answer
+    assert events[1][1]["cached"] is True
+
+
+def test_stream_rejects_an_empty_question(app):
+    (response,) = _post_all(app, [("/ask/stream", {"question": "  "})])
+    assert response.status_code == 400
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+from langchain_core.documents import Document
+
+from rag.config import load_settings
+from rag.vectorstore import build_faiss_index, delete_documents, embed_into_index, load_faiss_index, save_faiss_index
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_search_after_delete_and_add_maps_every_hit_to_its_chunk(tmp_path, index_type):
+    settings = replace(
+        load_settings(),
+        data_dir=tmp_path,
+        vectorstore_dir=tmp_path / "vectorstore",
+        embedding_provider="fake",
+        embedding_cache_max_entries=0,
+        index_type=index_type,
+        ivf_nlist=2,
+        ivf_nprobe=2,
+    )
+    texts = {f"chunk-{i:02d}": f"page text number {i}" for i in range(100)}
+    store = build_faiss_index(
+        settings, [Document(page_content=text) for text in texts.values()], list(texts)
+    )
+
+    # Drop chunks from the middle, then add new ones, as re-ingesting a changed PDF does
+    removed = [f"chunk-{i:02d}" for i in range(10, 40)]
+    assert delete_documents(store, removed) == len(removed)
+    added = {f"new-{i}": f"replacement text {i}" for i in range(30)}
+    store, _ = embed_into_index(settings, store, [(id_, Document(page_content=t)) for id_, t in added.items()])
+
+    save_faiss_index(store, settings.vectorstore_dir)
+    loaded = load_faiss_index(settings)
+    expected = {id_: text for id_, text in {**texts, **added}.items() if id_ not in removed}
+    assert loaded.index.ntotal == len(expected)
+    for id_, text in expected.items():
+        (hit,) = loaded.similarity_search(text, k=1)
+        assert hit.page_content == text